@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import random
+import re
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+PIN_COOKIE = 'pin_primary'
+
+_pinned = ContextVar('db_pinned', default=False)
+_writes = ContextVar('db_writes', default=None)
+
+
+class Writes:
+    """Была ли за запрос запись в основную базу.
+
+    Под ASGI представление пишет в потоке sync_to_async, а middleware
+    проверяет флаг в своём контексте, поэтому в ContextVar лежит общий
+    изменяемый объект, а не сам флаг.
+    """
+    happened = False
+
+
+def wrote():
+    writes = _writes.get()
+    return writes is not None and writes.happened
+
+
+CACHE_APP_LABEL = 'django_cache'
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != 'default']
+
+
+class ReplicaRouter:
+    """Чтение с реплик, запись и закреплённые запросы — в основную базу.
+
+    Таблица DatabaseCache всегда в основной базе: закрепления и версии
+    в кэше нельзя читать с отстающей реплики, а запись в кэш — не
+    запись данных и не закрепляет клиента.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return 'default'
+        replicas = replica_aliases()
+        if _pinned.get() or wrote() or not replicas:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return 'default'
+        writes = _writes.get()
+        if writes is None:
+            writes = Writes()
+            _writes.set(writes)
+        writes.happened = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaPinningMiddleware:
+    """Держит пользователя на основной базе после его записи.
+
+    Изменяющие запросы (и GET-переключатели из REPLICA_PRIMARY_PATHS)
+    целиком идут в основную базу. Если за запрос была запись, клиент
+    закрепляется за ней на REPLICA_PIN_SECONDS: по токену через общий
+    кэш и по cookie для сессий, чтобы сразу прочитать собственные
+    изменения. Кэш должен быть общим (см. CACHES): иначе следующий
+    запрос клиента в другом воркере уйдёт на отстающую реплику.
+    """
+
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.primary_paths = re.compile(settings.REPLICA_PRIMARY_PATHS)
+        if asyncio.iscoroutinefunction(get_response):
+            # По этому признаку Django ждёт middleware как корутину.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def client_key(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION')
+        if not header:
+            return None
+        return 'db_pin:' + hashlib.sha1(header.encode()).hexdigest()
+
+    def is_pinned(self, request, key):
+        return (
+            request.method not in self.safe_methods
+            or self.primary_paths.search(request.path) is not None
+            or PIN_COOKIE in request.COOKIES
+            or (key is not None and cache.get(key) is not None)
+        )
+
+    def pin(self, key, response):
+        if not wrote():
+            return
+        seconds = settings.REPLICA_PIN_SECONDS
+        if key is not None:
+            cache.set(key, 1, seconds)
+        response.set_cookie(PIN_COOKIE, '1', max_age=seconds)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        key = self.client_key(request)
+        pinned = _pinned.set(self.is_pinned(request, key))
+        writes = _writes.set(Writes())
+        try:
+            response = self.get_response(request)
+            self.pin(key, response)
+        finally:
+            _pinned.reset(pinned)
+            _writes.reset(writes)
+        return response
+
+    async def __acall__(self, request):
+        # Кэш может быть в базе: к нему ходим из потока, не из цикла.
+        key = self.client_key(request)
+        pinned = _pinned.set(
+            await sync_to_async(self.is_pinned)(request, key)
+        )
+        writes = _writes.set(Writes())
+        try:
+            response = await self.get_response(request)
+            await sync_to_async(self.pin)(key, response)
+        finally:
+            _pinned.reset(pinned)
+            _writes.reset(writes)
+        return response
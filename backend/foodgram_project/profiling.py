@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger('foodgram.profiling')
+
+_recorder = ContextVar('query_recorder', default=None)
+
+
+class QueryRecorder:
+    """Обёртка для connection.execute_wrapper: считает запросы и время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        """Одинаковые по тексту запросы — типичный признак N+1."""
+        return {sql: count for sql, count in self.statements.items()
+                if count > 1}
+
+    @contextmanager
+    def record(self, using=None):
+        aliases = [using] if using else list(connections)
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+
+def record_in_context(execute, sql, params, many, context):
+    """execute_wrapper всех соединений: пишет в QueryRecorder контекста.
+
+    Под ASGI синхронный код запроса работает в потоках sync_to_async со
+    своими соединениями, и обёртку не повесить на них из цикла событий.
+    sync_to_async копирует контекст в поток, поэтому рекордер из
+    ContextVar виден там, где выполняется SQL.
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_context_recorder(sender, connection, **kwargs):
+    if record_in_context not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_in_context)
+
+
+@contextmanager
+def query_budget(limit, using=None):
+    """Падает, если внутри блока выполнено больше limit запросов.
+
+    with query_budget(6):
+        client.get('/api/recipes/')
+    """
+    recorder = QueryRecorder()
+    with recorder.record(using):
+        yield recorder
+    if recorder.count > limit:
+        details = '\n'.join(
+            f'{count}x {sql}' for sql, count in recorder.duplicates.items()
+        )
+        raise AssertionError(
+            f'{recorder.count} queries, budget is {limit}.\n{details}'
+        )
+
+
+class RequestProfilingMiddleware:
+    """Считает SQL и время ответа для выборки запросов.
+
+    Результат уходит в заголовок Server-Timing и в лог
+    foodgram.profiling одной JSON-строкой. db — время SQL, render —
+    рендер ответа DRF, app — остаток: middleware, представление и
+    сериализаторы вместе, отдельно сериализаторы не замеряются. Доля
+    запросов задаётся настройкой
+    REQUEST_PROFILING_SAMPLE_RATE (0 — выключено). Под ASGI работает
+    асинхронно и не отправляет запрос в отдельный поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # По этому признаку Django ждёт middleware как корутину.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def sampled(self):
+        rate = getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 0)
+        return bool(rate) and random.random() < rate
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        timings = request._profiling_timings = {}
+        start = time.perf_counter()
+        with recorder.record():
+            response = self.get_response(request)
+        self.report(request, response, recorder, timings, start)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        timings = request._profiling_timings = {}
+        start = time.perf_counter()
+        token = _recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.report(request, response, recorder, timings, start)
+        return response
+
+    def report(self, request, response, recorder, timings, start):
+        total = time.perf_counter() - start
+        render = timings.get('render', 0.0)
+        app = max(total - recorder.duration - render, 0.0)
+
+        duplicates = recorder.duplicates
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={recorder.duration * 1000:.1f};'
+            f'desc="{recorder.count} queries, '
+            f'{sum(duplicates.values())} duplicated"',
+            f'app;dur={app * 1000:.1f}',
+            f'render;dur={render * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 1),
+            'app_ms': round(app * 1000, 1),
+            'render_ms': round(render * 1000, 1),
+            'total_ms': round(total * 1000, 1),
+            'duplicates': sorted(duplicates.values(), reverse=True)[:5],
+            'duplicate_sql': [
+                sql[:200] for sql, _ in
+                sorted(duplicates.items(), key=lambda item: -item[1])[:3]
+            ],
+        }, ensure_ascii=False))
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, '_profiling_timings', None)
+        if timings is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                timings['render'] = time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
@@ -26,6 +26,7 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'users.User'
 
 MIDDLEWARE = [
+    'foodgram_project.profiling.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,7 +44,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'],
@@ -55,6 +56,27 @@ REST_FRAMEWORK = {
                                 'NamespaceVersioning',
 }
 
+# Общий для всех воркеров кэш: версии индексов, фрагменты рецептов,
+# закрепление за основной базой. По умолчанию — таблица в базе
+# (manage.py createcachetable), в docker-compose — memcached.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'django_cache'),
+    }
+}
+
+TOKEN_AUTH_CACHE = {
+    'BACKEND': os.environ.get('TOKEN_AUTH_CACHE_BACKEND', 'shared'),
+    'TTL': int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 30)),
+    'REVOCATION_CHECK': float(
+        os.environ.get('TOKEN_AUTH_CACHE_REVOCATION_CHECK', 2)
+    ),
+    'MAX_SIZE': 10000,
+}
+
 DJOSER = {
 
     'SERIALIZERS': {
@@ -86,6 +108,12 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram_project.wsgi.application'
+ASGI_APPLICATION = 'foodgram_project.asgi.application'
+
+# Асинхронные переключатели избранного, корзины и подписки имеют смысл
+# только под ASGI-воркером (uvicorn), под WSGI оставляем синхронные.
+# Экспериментально: выигрыша над WSGI замер пока не показал (README).
+ASYNC_TOGGLE_VIEWS = os.environ.get('ASYNC_TOGGLE_VIEWS', '') == '1'
 
 DATABASES = {
     'default': {
@@ -98,6 +126,28 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=host1,host2:5433
+for number, replica in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{number}'] = dict(
+        DATABASES['default'],
+        HOST=host,
+        PORT=port or DATABASES['default']['PORT'],
+        TEST={'MIRROR': 'default'},
+    )
+
+if len(DATABASES) > 1:
+    DATABASE_ROUTERS = ['foodgram_project.db_router.ReplicaRouter']
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.common.CommonMiddleware'),
+        'foodgram_project.db_router.ReplicaPinningMiddleware'
+    )
+
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+# GET-запросы, которые пишут в базу, всегда идут в основную.
+REPLICA_PRIMARY_PATHS = r'/(favorite|shopping_cart|subscribe)/$'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.'
@@ -130,4 +180,34 @@ MEDIA_URL = "/dj_media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "dj_media")
 
 RECIPES_LIMIT = 6
+REQUEST_PROFILING_SAMPLE_RATE = float(
+    os.environ.get('REQUEST_PROFILING_SAMPLE_RATE', 0)
+)
+INGREDIENT_SEARCH_LIMIT = 20
+# Как часто воркер сверяет версию индекса ингредиентов с общим кэшем.
+INGREDIENT_INDEX_VERSION_CHECK = 5
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60
+TAG_CHOICES_TIMEOUT = 5 * 60
+IMAGE_VARIANT_WORKERS = 2
+SEARCH_CONFIG = 'russian'
+# Рецепты авторов, у которых подписчиков больше порога, не раскладываются
+# по лентам, а дочитываются при открытии ленты.
+FEED_FANOUT_LIMIT = 1000
+FEED_BACKFILL = 50
+FEED_MAX_PAGE_SIZE = 100
+RECIPE_BATCH_SIZE = 100
+SHOPPING_LIST_FONT = os.environ.get(
+    'SHOPPING_LIST_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+# PDF длиннее порога рисуется в пуле процессов, а не в потоке запроса.
+SHOPPING_LIST_PDF_POOL_THRESHOLD = 300
+SHOPPING_LIST_PDF_WORKERS = 2
+SHOPPING_LIST_PDF_TIMEOUT = 30
+SHOPPING_LIST_EXPORT_TIMEOUT = 60 * 60
+# Популярность: добавления за окно, вклад каждого вдвое меньше через
+# период полураспада.
+TRENDING_WINDOW_DAYS = 7
+TRENDING_HALF_LIFE_HOURS = 48
+TRENDING_FAVORITE_WEIGHT = 1.0
+TRENDING_CART_WEIGHT = 0.5
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
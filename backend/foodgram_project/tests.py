@@ -0,0 +1,173 @@
+import asyncio
+import re
+import unittest
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import (AsyncClient, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+
+from .db_router import PIN_COOKIE, ReplicaPinningMiddleware
+from .profiling import RequestProfilingMiddleware, query_budget
+
+User = get_user_model()
+
+LOCAL_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+async def async_view(request):
+    pass
+
+
+def sync_view(request):
+    pass
+
+
+class AsyncMiddlewareTest(TestCase):
+    """Под ASGI middleware не уводят запрос в поток."""
+
+    def test_follow_get_response_mode(self):
+        for middleware in (RequestProfilingMiddleware,
+                           ReplicaPinningMiddleware):
+            with self.subTest(middleware=middleware.__name__):
+                self.assertTrue(middleware.async_capable)
+                self.assertTrue(asyncio.iscoroutinefunction(
+                    middleware(async_view)
+                ))
+                self.assertFalse(asyncio.iscoroutinefunction(
+                    middleware(sync_view)
+                ))
+
+
+@override_settings(CACHES=LOCAL_CACHE, REQUEST_PROFILING_SAMPLE_RATE=1)
+class ProfilingTest(TestCase):
+    databases = '__all__'
+
+    async def get_async(self, path):
+        return await AsyncClient().get(path)
+
+    def queries(self, response):
+        return int(re.search(
+            r'(\d+) queries', response['Server-Timing']
+        ).group(1))
+
+    def test_async_request(self):
+        # SQL идёт в потоке sync_to_async, но попадает в Server-Timing.
+        response = async_to_sync(self.get_async)('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.queries(response),
+            self.queries(self.client.get('/api/recipes/'))
+        )
+        self.assertGreater(self.queries(response), 0)
+
+    def test_query_budget_lists_duplicates(self):
+        with self.assertRaisesRegex(AssertionError, r'2 queries.*\n2x '):
+            with query_budget(1):
+                Recipe.objects.exists()
+                Recipe.objects.exists()
+
+
+@unittest.skipUnless(
+    'replica_0' in settings.DATABASES,
+    'Нужна реплика: DB_REPLICA_HOSTS=<хост основной базы>'
+)
+class ReplicaPinningTest(TransactionTestCase):
+    """Чтение после записи идёт в основную базу в любом воркере.
+
+    Реплика в тестах — зеркало основной базы через отдельное
+    соединение, поэтому по запросам на каждом соединении видно, куда
+    роутер отправил чтение. Закрепление хранится в общем кэше.
+    """
+    databases = {'default', 'replica_0'}
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(
+            email='author@test.local', username='author'
+        )
+        self.recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='текст', cooking_time=10,
+            image='recipes/images/test.jpg'
+        )
+        self.headers = {}
+        self.writer = self.token_client('writer')
+        self.reader = self.token_client('reader')
+
+    def token_client(self, username):
+        user = User.objects.create(
+            email=f'{username}@test.local', username=username
+        )
+        self.headers[username] = f'Token {Token.objects.create(user=user)}'
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=self.headers[username])
+        return client
+
+    def get(self, client, path='/api/recipes/'):
+        """Запросы (к основной базе, к реплике) за один GET."""
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica_0']) as replica:
+                response = client.get(path)
+        self.assertLess(response.status_code, 300)
+        return response, len(primary), len(replica)
+
+    def test_reads_go_to_replica(self):
+        _, primary, replica = self.get(self.reader)
+        self.assertGreater(replica, 0)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    }})
+    def test_database_cache_stays_on_primary(self):
+        cache.clear()
+        with CaptureQueriesContext(connections['replica_0']) as replica:
+            response = APIClient().get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        # Запись фрагментов в холодный кэш не закрепляет анонима.
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertGreater(len(replica), 0)
+        self.assertFalse(any(
+            'django_cache' in query['sql'] for query in replica
+        ))
+
+    def test_token_pinned_after_write(self):
+        response, _, replica = self.get(
+            self.writer, f'/api/recipes/{self.recipe.id}/favorite/'
+        )
+        self.assertEqual(replica, 0)
+        # Другой воркер не знает о записи и видит только общий кэш.
+        self.writer.cookies.pop(PIN_COOKIE, None)
+        _, primary, replica = self.get(self.writer)
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+        _, _, replica = self.get(self.reader)
+        self.assertGreater(replica, 0)
+
+    def test_async_write_pins_token(self):
+        async def favorite():
+            return await AsyncClient().get(
+                f'/api/recipes/{self.recipe.id}/favorite/',
+                authorization=self.headers['writer']
+            )
+
+        self.assertEqual(async_to_sync(favorite)().status_code, 201)
+        _, _, replica = self.get(self.writer)
+        self.assertEqual(replica, 0)
+
+    def test_pin_expires(self):
+        self.get(self.writer, f'/api/recipes/{self.recipe.id}/favorite/')
+        self.writer.cookies.pop(PIN_COOKIE, None)
+        cache.clear()
+        _, _, replica = self.get(self.writer)
+        self.assertGreater(replica, 0)
@@ -13,6 +13,15 @@ class RecipeAdmin(admin.ModelAdmin):
               )
     readonly_fields = (
         'pub_date',
+        'favorites_count',
+        'in_carts_count',
+    )
+    list_display = (
+        'name',
+        'author',
+        'pub_date',
+        'favorites_count',
+        'in_carts_count',
     )
     empty_value_display = '-пусто-'
 
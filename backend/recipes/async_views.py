@@ -0,0 +1,38 @@
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from .views import FavoriteViewSet, FollowViewSet, ShoppingCartViewSet
+
+
+def async_view(view_class):
+    """Асинхронная обёртка над синхронным APIView.
+
+    В Django 3.2 нет асинхронного ORM, поэтому вся работа с базой
+    уходит в пул потоков через sync_to_async, а цикл событий ASGI-воркера
+    тем временем обслуживает другие запросы. Соединение с базой
+    закрывается в том же потоке, где было открыто.
+    """
+    view = view_class.as_view()
+
+    def run(request, *args, **kwargs):
+        try:
+            response = view(request, *args, **kwargs)
+            response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    run_in_thread = sync_to_async(run, thread_sensitive=False)
+
+    async def async_wrapper(request, *args, **kwargs):
+        return await run_in_thread(request, *args, **kwargs)
+
+    # DRF-представления не проверяют CSRF сами по себе (нужна сессия).
+    async_wrapper.csrf_exempt = True
+    async_wrapper.view_class = view_class
+    return async_wrapper
+
+
+favorite = async_view(FavoriteViewSet)
+shopping_cart = async_view(ShoppingCartViewSet)
+subscribe = async_view(FollowViewSet)
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Кэши, которые видит только один процесс.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """Фрагменты рецептов сбрасываются через кэш по умолчанию.
+
+    Если он у каждого воркера свой, удаление ключа видит только воркер,
+    изменивший рецепт, а остальные отдают старый фрагмент до истечения
+    RECIPE_FRAGMENT_TIMEOUT.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        'Кэш по умолчанию не общий для воркеров.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION (memcached) или '
+             'оставьте DatabaseCache по умолчанию.',
+        id='recipes.W001',
+    )]
@@ -0,0 +1,158 @@
+import csv
+import functools
+import hashlib
+import io
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+# Меняется вместе с видом файлов, чтобы не отдавать старые из кэша.
+EXPORT_VERSION = 1
+FONT_NAME = 'ShoppingListFont'
+TITLE = 'Список покупок'
+
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def register_fonts(path):
+    """Шрифт с кириллицей регистрируется один раз на процесс."""
+    pdfmetrics.registerFont(TTFont(FONT_NAME, path))
+
+
+def render_txt(rows):
+    return ''.join(
+        f'{name} - {amount} {unit} \n' for name, amount, unit in rows
+    ).encode()
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    writer.writerows(rows)
+    # BOM нужен Excel, чтобы открыть файл в UTF-8.
+    return buffer.getvalue().encode('utf-8-sig')
+
+
+def fit(text, width, size):
+    """Обрезает текст, чтобы он не наезжал на колонку количества."""
+    if pdfmetrics.stringWidth(text, FONT_NAME, size) <= width:
+        return text
+    while text and pdfmetrics.stringWidth(
+        text + '…', FONT_NAME, size
+    ) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+def render_pdf(rows, font_path, size=11):
+    register_fonts(font_path)
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle(TITLE)
+    width, height = A4
+    margin = 20 * mm
+    y = height - margin
+    pdf.setFont(FONT_NAME, 16)
+    pdf.drawString(margin, y, TITLE)
+    pdf.setFont(FONT_NAME, size)
+    y -= 12 * mm
+    for name, amount, unit in rows:
+        if y < margin:
+            pdf.showPage()
+            pdf.setFont(FONT_NAME, size)
+            y = height - margin
+        quantity = f'{amount} {unit}'
+        room = (width - 2 * margin - 5 * mm
+                - pdfmetrics.stringWidth(quantity, FONT_NAME, size))
+        pdf.drawString(margin, y, fit(f'• {name}', room, size))
+        pdf.drawRightString(width - margin, y, quantity)
+        y -= 7 * mm
+    pdf.save()
+    return buffer.getvalue()
+
+
+def get_executor():
+    global _executor, _slots
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = settings.SHOPPING_LIST_PDF_WORKERS
+                _slots = threading.BoundedSemaphore(workers * 2)
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=register_fonts,
+                    initargs=(settings.SHOPPING_LIST_FONT,),
+                )
+    return _executor, _slots
+
+
+def reset_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+
+
+def render_pdf_in_pool(rows):
+    """Большой PDF рисуется в отдельном процессе, не занимая GIL воркера.
+
+    Одновременно в пуле не больше двух задач на процесс: остальные
+    запросы ждут слота, а не копят очередь.
+    """
+    executor, slots = get_executor()
+    with slots:
+        try:
+            return executor.submit(
+                render_pdf, rows, settings.SHOPPING_LIST_FONT
+            ).result(settings.SHOPPING_LIST_PDF_TIMEOUT)
+        except BrokenProcessPool:
+            reset_executor(executor)
+            raise
+
+
+def pdf(rows):
+    if len(rows) < settings.SHOPPING_LIST_PDF_POOL_THRESHOLD:
+        return render_pdf(rows, settings.SHOPPING_LIST_FONT)
+    return render_pdf_in_pool(rows)
+
+
+FORMATS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'pdf': pdf,
+}
+
+
+def export_key(fmt, rows):
+    digest = hashlib.sha256(
+        json.dumps(rows, ensure_ascii=False).encode()
+    ).hexdigest()
+    return f'shopping_list_export:{EXPORT_VERSION}:{fmt}:{digest}'
+
+
+def export(fmt, rows):
+    """Файл списка покупок из строк (название, количество, единица).
+
+    Результат кэшируется по хэшу содержимого, поэтому одинаковые
+    списки, в том числе у разных пользователей, рисуются один раз.
+    """
+    render = FORMATS[fmt]
+    key = export_key(fmt, rows)
+    content = cache.get(key)
+    if content is None:
+        content = render(rows)
+        cache.set(key, content, settings.SHOPPING_LIST_EXPORT_TIMEOUT)
+    return content
@@ -0,0 +1,173 @@
+import base64
+import binascii
+from collections import namedtuple
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from .models import FeedEntry, Follow, Recipe
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+FeedItem = namedtuple('FeedItem', ('id', 'author_id', 'pub_date'))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def is_fanned_out(author_id):
+    """Раскладываются ли рецепты автора по лентам при публикации."""
+    return User.objects.filter(
+        pk=author_id, followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).exists()
+
+
+def write_entries(rows):
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                   author_id=author_id, pub_date=pub_date)
+         for user_id, recipe_id, author_id, pub_date in rows),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out(recipe):
+    """Кладёт новый рецепт в ленты подписчиков автора."""
+    if not is_fanned_out(recipe.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True)
+    write_entries(
+        (user_id, recipe.id, recipe.author_id, recipe.pub_date)
+        for user_id in followers
+    )
+
+
+def latest_recipes(author_id):
+    return list(Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL])
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние рецепты автора после подписки."""
+    if not is_fanned_out(author_id):
+        return
+    write_entries(
+        (user_id, recipe_id, author_id, pub_date)
+        for recipe_id, pub_date in latest_recipes(author_id)
+    )
+
+
+def backfill_followers(author_id):
+    """Раскладывает рецепты автора, опустившегося до FEED_FANOUT_LIMIT.
+
+    Пока подписчиков было больше порога, его рецепты дочитывались при
+    открытии ленты и в FeedEntry не попадали. Без этого после отписки
+    старые рецепты пропали бы из лент оставшихся подписчиков.
+    """
+    if not is_fanned_out(author_id):
+        return
+    recipes = latest_recipes(author_id)
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    write_entries(
+        (user_id, recipe_id, author_id, pub_date)
+        for user_id in followers.iterator()
+        for recipe_id, pub_date in recipes
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает рецепты автора из ленты после отписки."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def encode_cursor(item):
+    value = f'{item.pub_date.isoformat()}|{item.id}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        pub_date, pk = base64.urlsafe_b64decode(
+            cursor.encode()
+        ).decode().split('|')
+        return datetime.fromisoformat(pub_date), int(pk)
+    except (binascii.Error, UnicodeError, ValueError) as error:
+        raise InvalidCursor(cursor) from error
+
+
+def before(position, date_field, id_field):
+    """Строго после курсора в порядке (-pub_date, -id).
+
+    pub_date__lte дублирует условие, чтобы оно стало границей
+    диапазона в индексе, а не фильтром после него.
+    """
+    pub_date, pk = position
+    return Q(**{f'{date_field}__lte': pub_date}) & (
+        Q(**{f'{date_field}__lt': pub_date})
+        | Q(**{date_field: pub_date, f'{id_field}__lt': pk})
+    )
+
+
+def get_feed_page(user, cursor=None, limit=6):
+    """Страница ленты подписок и курсор следующей страницы.
+
+    Основная часть читается из FeedEntry одним диапазоном индекса.
+    Рецепты авторов с подписчиками сверх FEED_FANOUT_LIMIT в ленты не
+    раскладываются и дочитываются отдельным запросом по индексу
+    (author, -pub_date, -id), после чего обе части сливаются.
+    """
+    entries = FeedEntry.objects.filter(user=user)
+    popular = Recipe.objects.filter(author__in=Follow.objects.filter(
+        user=user, author__followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).values('author_id'))
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        entries = entries.filter(before(position, 'pub_date', 'recipe_id'))
+        popular = popular.filter(before(position, 'pub_date', 'id'))
+    items = [FeedItem(*row) for row in entries.order_by(
+        '-pub_date', '-recipe_id'
+    ).values_list('recipe_id', 'author_id', 'pub_date')[:limit + 1]]
+    items += [FeedItem(*row) for row in popular.order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'author_id', 'pub_date')[:limit + 1]]
+    # Автор мог перейти порог, когда его рецепты уже лежали в лентах.
+    items = sorted(
+        {item.id: item for item in items}.values(),
+        key=lambda item: (item.pub_date, item.id), reverse=True
+    )
+    page = items[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(items) > limit else None
+    return page, next_cursor
+
+
+def rebuild(users=None):
+    """Пересобирает ленты с нуля, например после массовой загрузки."""
+    followers = Follow.objects.order_by().values_list(
+        'user_id', flat=True
+    ).distinct()
+    if users is not None:
+        followers = followers.filter(user__in=users)
+    total = 0
+    for user_id in list(followers):
+        FeedEntry.objects.filter(user_id=user_id).delete()
+        recipes = Recipe.objects.filter(
+            author__following__user_id=user_id,
+            author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+        ).latest_per_author(settings.FEED_BACKFILL).values_list(
+            'id', 'author_id', 'pub_date'
+        )
+        rows = [(user_id, *row) for row in recipes]
+        write_entries(rows)
+        total += len(rows)
+    return total
@@ -4,6 +4,7 @@ import uuid
 
 import six
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
 
@@ -29,3 +30,19 @@ class Base64ImageField(serializers.ImageField):
         extension = imghdr.what(file_name, decoded_file)
         extension = 'jpg' if extension == 'jpeg' else extension
         return extension
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки: {вариант: {формат: url}}."""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for variant, formats in (value or {}).items():
+            urls[variant] = {}
+            for fmt, name in formats.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[variant][fmt] = url
+        return urls
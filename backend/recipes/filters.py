@@ -1,26 +1,86 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from .models import Recipe, Ingredient
+from .models import Favorite, Ingredient, ReceiptTag, Recipe, ShoppingCart, Tag
+
+TAG_CHOICES_KEY = 'tag_choices'
+
+
+def get_tag_choices():
+    """Слаги тегов для проверки ?tags=, из общего кэша.
+
+    Сигналы Tag удаляют ключ, а TAG_CHOICES_TIMEOUT ограничивает срок,
+    если удаление не дошло до кэша, — иначе новый слаг получал бы 400.
+    """
+    choices = cache.get(TAG_CHOICES_KEY)
+    if choices is None:
+        choices = [(slug, slug) for slug in
+                   Tag.objects.values_list('slug', flat=True)]
+        cache.set(
+            TAG_CHOICES_KEY, choices, settings.TAG_CHOICES_TIMEOUT
+        )
+    return choices
+
+
+def invalidate_tag_choices():
+    cache.delete(TAG_CHOICES_KEY)
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='receipttag__tag__slug')
+    """Все фильтры дописываются к одной выборке.
+
+    Теги, избранное и корзина проверяются через EXISTS, поэтому JOIN
+    не размножает строки и DISTINCT не нужен.
+    """
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices, method='filter_tags'
+    )
+    author = filters.NumberFilter(field_name='author')
     is_favorited = filters.BooleanFilter(method='get_favorite')
     is_in_shopping_cart = filters.BooleanFilter(method='get_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'Популярные за неделю'),),
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
+        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags',
+                  'search', 'ordering')
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(ReceiptTag.objects.filter(
+            recipe=OuterRef('pk'), tag__slug__in=value
+        )))
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск, сортирует выдачу по релевантности."""
+        return queryset.search(value)
+
+    def filter_ordering(self, queryset, name, value):
+        """ordering=popular: только рецепты из RecipeScore, по индексу."""
+        return queryset.popular()
+
+    def filter_by_user(self, queryset, model, value):
+        if not value:
+            return queryset
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )))
 
     def get_favorite(self, queryset, name, value):
-        if value:
-            return Recipe.objects.filter(favorites__user=self.request.user)
-        return Recipe.objects.all()
+        return self.filter_by_user(queryset, Favorite, value)
 
     def get_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return Recipe.objects.filter(shopping_cart__user=self.request.user)
-        return Recipe.objects.all()
+        return self.filter_by_user(queryset, ShoppingCart, value)
 
 
 class IngredientFilter(filters.FilterSet):
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Favorite, Follow, Recipe, ShoppingCart
+from .serializers import ShowRecipeSerializer
+
+# Меняется вместе с форматом ShowRecipeSerializer, чтобы не отдавать
+# фрагменты старого вида после выкладки.
+FRAGMENT_VERSION = 2
+
+
+def fragment_key(recipe_id):
+    return f'recipe_fragment:{FRAGMENT_VERSION}:{recipe_id}'
+
+
+def invalidate(recipe_ids):
+    """Удаляет фрагменты после коммита, чтобы не закэшировать старое.
+
+    Кэш по умолчанию общий для воркеров (см. CACHES и recipes.W001),
+    поэтому удаление видят все процессы, а не только этот.
+    """
+    keys = [fragment_key(recipe_id) for recipe_id in recipe_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def build_fragments(recipe_ids):
+    """Сериализует рецепты без привязки к пользователю и кладёт в кэш."""
+    recipes = list(Recipe.objects.for_show(None).filter(id__in=recipe_ids))
+    fragments = {
+        recipe.id: data for recipe, data in zip(
+            recipes,
+            ShowRecipeSerializer(recipes, many=True, context={}).data
+        )
+    }
+    cache.set_many(
+        {fragment_key(recipe_id): data
+         for recipe_id, data in fragments.items()},
+        settings.RECIPE_FRAGMENT_TIMEOUT
+    )
+    return fragments
+
+
+def get_user_flags(user, recipe_ids, author_ids):
+    if user is None or user.is_anonymous:
+        return set(), set(), set()
+    favorited = set(Favorite.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    in_cart = set(ShoppingCart.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    subscribed = set(Follow.objects.filter(
+        user=user, author_id__in=author_ids
+    ).order_by().values_list('author_id', flat=True))
+    return favorited, in_cart, subscribed
+
+
+def render_recipes(recipes, request):
+    """Собирает ShowRecipeSerializer-представления страницы рецептов.
+
+    Общая часть берётся из кэша одним get_many, промахи сериализуются
+    разом, а поля пользователя накладываются поверх по трём выборкам.
+    """
+    recipe_ids = [recipe.id for recipe in recipes]
+    cached = cache.get_many([fragment_key(pk) for pk in recipe_ids])
+    fragments = {pk: cached[fragment_key(pk)]
+                 for pk in recipe_ids if fragment_key(pk) in cached}
+    missing = [pk for pk in recipe_ids if pk not in fragments]
+    if missing:
+        fragments.update(build_fragments(missing))
+    favorited, in_cart, subscribed = get_user_flags(
+        request.user,
+        recipe_ids,
+        {recipe.author_id for recipe in recipes}
+    )
+    data = []
+    for pk in recipe_ids:
+        fragment = fragments.get(pk)
+        if fragment is None:
+            # Рецепт удалили между выборкой страницы и сериализацией.
+            continue
+        item = dict(fragment)
+        item['author'] = dict(
+            fragment['author'],
+            is_subscribed=fragment['author']['id'] in subscribed
+        )
+        item['is_favorited'] = pk in favorited
+        item['is_in_shopping_cart'] = pk in in_cart
+        if item['image']:
+            item['image'] = request.build_absolute_uri(item['image'])
+        item['image_variants'] = {
+            variant: {fmt: request.build_absolute_uri(url)
+                      for fmt, url in formats.items()}
+            for variant, formats in item['image_variants'].items()
+        }
+        data.append(item)
+    return data
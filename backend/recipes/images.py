@@ -0,0 +1,92 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'optimize': True,
+             'progressive': True},
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_VARIANT_WORKERS,
+                    thread_name_prefix='image-variants'
+                )
+    return _executor
+
+
+def variant_name(image_name, variant, fmt):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'recipes/images/variants/{stem}_{variant}.{EXTENSIONS[fmt]}'
+
+
+def render_variants(image_name):
+    """Сохраняет уменьшенные копии картинки и возвращает их пути."""
+    with default_storage.open(image_name) as fp:
+        source = ImageOps.exif_transpose(Image.open(fp))
+        source = source.convert('RGB')
+    variants = {}
+    for variant, size in VARIANTS.items():
+        image = source.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        variants[variant] = {}
+        for fmt, options in FORMATS.items():
+            buffer = io.BytesIO()
+            image.save(buffer, **options)
+            name = variant_name(image_name, variant, fmt)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            variants[variant][fmt] = default_storage.save(
+                name, ContentFile(buffer.getvalue())
+            )
+    return variants
+
+
+def generate_variants(recipe_id, image_name):
+    try:
+        variants = render_variants(image_name)
+        # Картинку могли заменить, пока шла обработка: тогда пропускаем.
+        recipe = Recipe.objects.filter(pk=recipe_id, image=image_name).first()
+        if recipe is not None:
+            recipe.image_variants = variants
+            recipe.save(update_fields=['image_variants'])
+    except Exception:
+        logger.exception('Не удалось подготовить копии %s', image_name)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(recipe):
+    """Ставит обработку картинки в пул после коммита транзакции."""
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(lambda: get_executor().submit(
+        generate_variants, recipe_id, image_name
+    ))
+
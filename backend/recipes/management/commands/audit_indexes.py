@@ -0,0 +1,159 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from recipes.filters import RecipeFilter
+from recipes.models import (Favorite, FeedEntry, Follow, Recipe,
+                            ShoppingCart, Tag)
+from recipes.shopping_list import get_cart_ingredients, get_shopping_list
+from recipes.views import ListFollowViewSet
+
+User = get_user_model()
+
+PAGE = 6
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from walk(child)
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет EXPLAIN для запросов фильтров рецептов, подписок, '
+            'корзины и ленты и падает, если план читает большую таблицу '
+            'последовательным сканированием. Нужны данные generate_data '
+            'и PostgreSQL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=10000,
+                            help='С какого размера таблица считается '
+                                 'большой.')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Сначала обновить статистику ANALYZE.')
+        parser.add_argument('--plans', action='store_true',
+                            help='Печатать план каждого запроса.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Аудит планов работает только с PostgreSQL.')
+        # Самая большая корзина — самый тяжёлый случай для её запросов.
+        busiest = ShoppingCart.objects.values('user').annotate(
+            total=Count('id')
+        ).order_by('-total').values_list('user', flat=True).first()
+        if busiest is None:
+            raise CommandError('Сначала выполните manage.py generate_data.')
+        user = User.objects.get(pk=busiest)
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        sizes = self.table_sizes()
+        failures = 0
+        for title, queryset in self.queries(user):
+            plan = self.explain(queryset)
+            scans = sorted({
+                node['Relation Name'] for node in walk(plan)
+                if node['Node Type'] == 'Seq Scan'
+                and sizes.get(node['Relation Name'], 0) >= options['min_rows']
+            })
+            if scans:
+                failures += 1
+                tables = ', '.join(f'{table} ({sizes[table]})'
+                                   for table in scans)
+                self.stdout.write(self.style.ERROR(
+                    f'SEQ  {title}: {tables}'
+                ))
+            else:
+                self.stdout.write(f'ok   {title}')
+            if scans or options['plans']:
+                self.stdout.write(queryset.explain())
+        if failures:
+            raise CommandError(
+                f'Последовательное сканирование в {failures} запросах.'
+            )
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        # psycopg2 разбирает json сам, другие драйверы отдают строку.
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']
+
+    def table_sizes(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'"
+            )
+            return {name: int(rows) for name, rows in cursor.fetchall()}
+
+    def filtered(self, user, params):
+        """Первая страница списка рецептов так, как её строит RecipeViewSet."""
+        request = RequestFactory().get('/api/recipes/', params)
+        request.user = user
+        queryset = Recipe.objects.only('id', 'author', 'pub_date')
+        if 'order_by' in params:
+            queryset = queryset.order_by(*params.pop('order_by'))
+        return RecipeFilter(params, queryset, request=request).qs[:PAGE]
+
+    def queries(self, user):
+        tag = Tag.objects.values_list('slug', flat=True).first()
+        recipe = ShoppingCart.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        ).first()
+        follows = ListFollowViewSet()
+        follows.request = Request(RequestFactory().get('/'))
+        follows.request.user = user
+        authors = follows.get_queryset()[:PAGE]
+        return (
+            ('рецепты по name, pub_date', self.filtered(user, {})),
+            ('рецепты по курсору', self.filtered(
+                user, {'order_by': ('-pub_date', '-id')}
+            )),
+            ('рецепты автора', self.filtered(
+                user, {'author': user.pk, 'order_by': ('-pub_date', '-id')}
+            )),
+            ('рецепты по тегу', self.filtered(user, {'tags': [tag]})),
+            ('рецепты в избранном', self.filtered(
+                user, {'is_favorited': 'true'}
+            )),
+            ('рецепты в корзине', self.filtered(
+                user, {'is_in_shopping_cart': 'true'}
+            )),
+            ('поиск рецептов', self.filtered(user, {'search': 'суп'})),
+            ('популярные рецепты', self.filtered(
+                user, {'ordering': 'popular'}
+            )),
+            ('подписки', authors),
+            # Так prefetch_related достаёт рецепты авторов страницы.
+            ('рецепты подписок', Recipe.objects.filter(
+                author__following__user=user
+            ).latest_per_author(PAGE).filter(
+                author__in=[author.pk for author in authors]
+            )),
+            ('подписки по дате', Follow.objects.filter(user=user)[:PAGE]),
+            ('избранное по дате', Favorite.objects.filter(
+                user=user
+            ).order_by('-added_date')[:PAGE]),
+            ('корзина по дате', ShoppingCart.objects.filter(
+                user=user
+            ).order_by('-added_date')[:PAGE]),
+            ('размер корзины',
+             ShoppingCart.objects.filter(user=user).values('user')
+             .annotate(total=Count('id'))),
+            ('список покупок', get_shopping_list(user)),
+            ('список покупок по корзине', get_cart_ingredients(user)),
+            ('корзины с рецептом', ShoppingCart.objects.filter(
+                recipe_id=recipe
+            ).values('user_id')),
+            ('лента подписок', FeedEntry.objects.filter(
+                user=user
+            ).order_by('-pub_date', '-recipe_id')[:PAGE + 1]),
+        )
@@ -0,0 +1,254 @@
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from foodgram_project.profiling import QueryRecorder
+from recipes.management.commands.generate_data import PASSWORD
+from recipes.models import Follow, Ingredient, Recipe, ShoppingCart, Tag
+
+User = get_user_model()
+
+# 1x1 PNG для создания рецепта.
+PIXEL = ('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8'
+         '/5+hHgAHggJ/PchI7wAAAABJRU5ErkJggg==')
+# Сколько рецептов добавляется пачкой и по одному в сравнении.
+BATCH = 20
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(share * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет все маршруты API через тестовый клиент и пишет '
+            'перцентили задержки, число запросов и пик памяти в JSON. '
+            'Нужна база, заполненная generate_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--output', default='bench-results.json')
+        parser.add_argument('--compare',
+                            help='JSON прошлого запуска для сравнения.')
+        parser.add_argument('--only', nargs='+',
+                            help='Имена сценариев, которые нужно запустить.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(
+            username__startswith='bench', shopping_cart__isnull=False
+        ).first()
+        if user is None:
+            raise CommandError('Сначала выполните manage.py generate_data.')
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.anonymous = Client()
+
+        results = {}
+        for name, scenario in self.get_scenarios(user).items():
+            if options['only'] and name not in options['only']:
+                continue
+            results[name] = self.measure(scenario, options['iterations'])
+            self.report(name, results[name])
+
+        report = {
+            'revision': git_revision(),
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результаты записаны в {options["output"]}')
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def get_scenarios(self, user):
+        client, anonymous = self.client, self.anonymous
+        recipe = Recipe.objects.exclude(author=user).exclude(
+            favorites__user=user
+        ).exclude(shopping_cart__user=user).order_by('id').first()
+        author = User.objects.exclude(pk=user.pk).exclude(
+            following__user=user
+        ).order_by('id').first()
+        batch = list(Recipe.objects.exclude(favorites__user=user).exclude(
+            shopping_cart__user=user
+        ).order_by('-id').values_list('id', flat=True)[:BATCH])
+        tag = Tag.objects.order_by('id').first()
+        ingredients = list(Ingredient.objects.values_list('id', flat=True)[:5])
+        followed = Follow.objects.filter(user=user).values_list(
+            'author_id', flat=True
+        ).first()
+        carted = ShoppingCart.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        ).first()
+
+        def get(url, as_client=client):
+            return lambda: [as_client.get(url)]
+
+        def toggle(url):
+            return lambda: [client.get(url), client.delete(url)]
+
+        def create_and_delete():
+            response = client.post('/api/recipes/', json.dumps({
+                'tags': [tag.id],
+                'ingredients': [{'id': pk, 'amount': 10}
+                                for pk in ingredients],
+                'name': 'Бенчмарк',
+                'image': f'data:image/png;base64,{PIXEL}',
+                'text': 'Рецепт для замера.',
+                'cooking_time': 5,
+            }), content_type='application/json')
+            created = response.json()['id']
+            return [response, client.delete(f'/api/recipes/{created}/')]
+
+        def singles(kind):
+            def run():
+                return [
+                    response for pk in batch
+                    for response in (
+                        client.get(f'/api/recipes/{pk}/{kind}/'),
+                        client.delete(f'/api/recipes/{pk}/{kind}/'),
+                    )
+                ]
+            return run
+
+        def batched(kind):
+            body = json.dumps({'recipes': batch})
+
+            def run():
+                return [
+                    client.post(f'/api/recipes/{kind}/', body,
+                                content_type='application/json'),
+                    client.delete(f'/api/recipes/{kind}/', body,
+                                  content_type='application/json'),
+                ]
+            return run
+
+        def login():
+            return [anonymous.post('/api/auth/token/login/', {
+                'email': user.email, 'password': PASSWORD
+            })]
+
+        return {
+            'tags list': get('/api/tags/', anonymous),
+            'tag detail': get(f'/api/tags/{tag.id}/', anonymous),
+            'ingredients list': get('/api/ingredients/', anonymous),
+            'ingredients search': get('/api/ingredients/?name=мол',
+                                      anonymous),
+            'ingredient detail': get(f'/api/ingredients/{ingredients[0]}/',
+                                     anonymous),
+            'recipes list anonymous': get('/api/recipes/?limit=6',
+                                          anonymous),
+            'recipes list': get('/api/recipes/?limit=6'),
+            'recipes list page 20': get('/api/recipes/?limit=6&page=20'),
+            'recipes list cursor': get(
+                '/api/recipes/?limit=6&pagination=cursor'
+            ),
+            'recipes by tag': get(f'/api/recipes/?limit=6&tags={tag.slug}'),
+            'recipes favorited': get('/api/recipes/?limit=6&is_favorited=1'),
+            'recipes in cart': get(
+                '/api/recipes/?limit=6&is_in_shopping_cart=1'
+            ),
+            'recipes by author': get(
+                f'/api/recipes/?limit=6&author={followed}'
+            ),
+            'recipes popular': get('/api/recipes/?limit=6&ordering=popular'),
+            'recipe detail': get(f'/api/recipes/{carted}/'),
+            'recipe create+delete': create_and_delete,
+            'favorite toggle': toggle(f'/api/recipes/{recipe.id}/favorite/'),
+            'shopping cart toggle': toggle(
+                f'/api/recipes/{recipe.id}/shopping_cart/'
+            ),
+            f'favorite x{BATCH} singles': singles('favorite'),
+            f'favorite x{BATCH} batch': batched('favorite'),
+            f'shopping cart x{BATCH} singles': singles('shopping_cart'),
+            f'shopping cart x{BATCH} batch': batched('shopping_cart'),
+            'download shopping cart': get(
+                '/api/recipes/download_shopping_cart/'
+            ),
+            'subscription feed': get('/api/recipes/feed/?limit=6'),
+            'subscriptions': get('/api/users/subscriptions/?recipes_limit=3'),
+            'subscribe toggle': toggle(f'/api/users/{author.id}/subscribe/'),
+            'users list': get('/api/users/'),
+            'user detail': get(f'/api/users/{author.id}/'),
+            'users me': get('/api/users/me/'),
+            'token login': login,
+        }
+
+    def run_once(self, scenario):
+        responses = scenario()
+        for response in responses:
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return [response.status_code for response in responses]
+
+    def measure(self, scenario, iterations):
+        statuses = self.run_once(scenario)
+        latencies = []
+        recorder = QueryRecorder()
+        with recorder.record():
+            for _ in range(iterations):
+                start = time.perf_counter()
+                self.run_once(scenario)
+                latencies.append((time.perf_counter() - start) * 1000)
+        tracemalloc.start()
+        self.run_once(scenario)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            'status': statuses,
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'mean_ms': round(statistics.mean(latencies), 2),
+            'queries': recorder.count / iterations,
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    def report(self, name, result):
+        statuses = sorted(set(result['status']))
+        self.stdout.write(
+            f'{name:<26} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} '
+            f'{result["p99_ms"]:>8.2f} ms {result["queries"]:>6.1f} q '
+            f'{result["peak_kib"]:>8.1f} KiB {statuses}'
+        )
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as fp:
+            previous = json.load(fp)
+        self.stdout.write(f'Сравнение с {previous.get("revision")}:')
+        for name, result in results.items():
+            old = previous['results'].get(name)
+            if old is None:
+                continue
+            ratio = result['p50_ms'] / old['p50_ms'] if old['p50_ms'] else 0
+            self.stdout.write(
+                f'{name:<26} p50 x{ratio:.2f} '
+                f'queries {old["queries"]:.1f} -> {result["queries"]:.1f}'
+            )
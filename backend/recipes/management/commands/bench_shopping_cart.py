@@ -0,0 +1,149 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, ShoppingCart
+from recipes import exports, shopping_list
+from recipes.shopping_list import (get_cart_ingredients, get_shopping_list,
+                                   iter_txt, readable)
+
+User = get_user_model()
+
+INGREDIENTS_PER_RECIPE = 8
+# Одни и те же продукты в разных единицах, чтобы работало приведение.
+UNITS = ('г', 'кг', 'мл', 'л', 'ст. л.', 'ч. л.', 'шт.')
+
+
+def legacy_shopping_list(user):
+    """Прежняя реализация DownloadShoppingCart: обход корзины в Python."""
+    buying_list = {}
+    for item in user.shopping_cart.all():
+        for ingredient in RecipeIngredient.objects.filter(recipe=item.recipe):
+            name = ingredient.ingredient.name
+            if name not in buying_list:
+                buying_list[name] = {
+                    'measurement_unit': ingredient.ingredient.measurement_unit,
+                    'amount': ingredient.amount
+                }
+            else:
+                buying_list[name]['amount'] += ingredient.amount
+    return [f'{name} - {item["amount"]} {item["measurement_unit"]} \n'
+            for name, item in buying_list.items()]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает прежнюю сборку списка покупок, сборку по корзине '
+            'и чтение готового ShoppingListItem на корзинах разного '
+            'размера, затем выгрузку в txt, csv и pdf. Данные '
+            'откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[1, 50, 500])
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='Сколько разных ингредиентов в рецептах.')
+        parser.add_argument('--skip-legacy', action='store_true',
+                            help='Не мерить прежнюю реализацию, '
+                                 'для больших корзин.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['sizes'], options['repeat'],
+                         options['ingredients'], options['skip_legacy'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def measure(self, func, user, repeat):
+        best = None
+        for _ in range(repeat):
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                func(user)
+                elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000, len(ctx.captured_queries)
+
+    def run(self, sizes, repeat, ingredient_count, skip_legacy):
+        author = User.objects.create(email='bench-author@bench.local',
+                                     username='bench_author')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench {i // len(UNITS)}',
+                       measurement_unit=UNITS[i % len(UNITS)])
+            for i in range(ingredient_count)
+        )
+        Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'bench {i}', text='bench',
+                   cooking_time=1, image='recipes/images/bench.jpg')
+            for i in range(max(sizes))
+        )
+        # Не все бэкенды возвращают pk из bulk_create, поэтому перечитываем.
+        ingredients = list(
+            Ingredient.objects.filter(name__startswith='bench ')
+        )
+        recipes = list(Recipe.objects.filter(author=author))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredients[(n + i) % len(ingredients)],
+                amount=i + 1
+            )
+            for n, recipe in enumerate(recipes)
+            for i in range(INGREDIENTS_PER_RECIPE)
+        )
+        self.stdout.write(f'{"recipes":>8} {"lines":>7} {"legacy ms":>10} '
+                          f'{"queries":>8} {"cart ms":>8} {"us/line":>8} '
+                          f'{"list ms":>8} {"queries":>8}')
+        users = []
+        for size in sizes:
+            user = User.objects.create(email=f'bench-{size}@bench.local',
+                                       username=f'bench_{size}')
+            ShoppingCart.objects.bulk_create(
+                ShoppingCart(user=user, recipe=recipe)
+                for recipe in recipes[:size]
+            )
+            shopping_list.rebuild([user.id])
+            users.append(user)
+            lines = size * INGREDIENTS_PER_RECIPE
+            legacy_ms, legacy_queries = 0.0, 0
+            if not skip_legacy:
+                legacy_ms, legacy_queries = self.measure(
+                    legacy_shopping_list, user, repeat)
+            cart_ms, _ = self.measure(
+                lambda u: list(iter_txt(get_cart_ingredients(u))),
+                user, repeat)
+            list_ms, list_queries = self.measure(
+                lambda u: list(iter_txt(get_shopping_list(u))), user, repeat)
+            self.stdout.write(f'{size:>8} {lines:>7} {legacy_ms:>10.1f} '
+                              f'{legacy_queries:>8} {cart_ms:>8.1f} '
+                              f'{cart_ms * 1000 / lines:>8.2f} '
+                              f'{list_ms:>8.1f} {list_queries:>8}')
+        self.export(users, repeat)
+
+    def export(self, users, repeat):
+        self.stdout.write(f'\n{"rows":>8} {"txt ms":>8} {"csv ms":>8} '
+                          f'{"pdf ms":>8} {"cached ms":>10}')
+        for user in users:
+            rows = [(item['ingredient__name'], *readable(item))
+                    for item in get_shopping_list(user)]
+            timings = [
+                self.measure(lambda _: exports.FORMATS[fmt](rows),
+                             user, repeat)[0]
+                for fmt in ('txt', 'csv', 'pdf')
+            ]
+            exports.export('pdf', rows)
+            cached_ms, _ = self.measure(
+                lambda _: exports.export('pdf', rows), user, repeat)
+            self.stdout.write(f'{len(rows):>8} {timings[0]:>8.1f} '
+                              f'{timings[1]:>8.1f} {timings[2]:>8.1f} '
+                              f'{cached_ms:>10.2f}')
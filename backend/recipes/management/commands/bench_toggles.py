@@ -0,0 +1,77 @@
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Меряет пропускную способность переключателей избранного, '
+            'корзины и подписки на запущенном сервере. Запустите его под '
+            'gunicorn (WSGI) и под uvicorn-воркером с ASYNC_TOGGLE_VIEWS=1 '
+            'с одинаковым числом воркеров и сравните результаты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=32,
+                            help='Сколько разных пользователей кликают.')
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(
+            username__startswith='bench'
+        ).order_by('id')[:options['users']])
+        recipes = list(Recipe.objects.order_by('id').values_list(
+            'id', 'author_id'
+        )[:50])
+        if not users or not recipes:
+            raise CommandError('Сначала выполните manage.py generate_data.')
+        tokens = [Token.objects.get_or_create(user=user)[0].key
+                  for user in users]
+        base = options['url'].rstrip('/')
+        paths = [
+            f'/api/recipes/{recipes[0][0]}/favorite/',
+            f'/api/recipes/{recipes[0][0]}/shopping_cart/',
+        ]
+        authors = [author for _, author in recipes]
+
+        def toggle(number):
+            token = tokens[number % len(tokens)]
+            user = users[number % len(users)]
+            kind = number % 3
+            if kind == 2:
+                author = next(a for a in authors if a != user.pk)
+                path = f'/api/users/{author}/subscribe/'
+            else:
+                path = paths[kind]
+            statuses = []
+            for method in ('GET', 'DELETE'):
+                request = urllib.request.Request(
+                    base + path, method=method,
+                    headers={'Authorization': f'Token {token}'}
+                )
+                try:
+                    with urllib.request.urlopen(request) as response:
+                        statuses.append(response.status)
+                except urllib.error.HTTPError as error:
+                    statuses.append(error.code)
+            return statuses
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(toggle, range(options['requests'])))
+        elapsed = time.perf_counter() - start
+        ok = sum(1 for statuses in results if statuses == [201, 204])
+        self.stdout.write(
+            f'{len(results)} переключений (x2 запроса) за {elapsed:.2f} с: '
+            f'{len(results) * 2 / elapsed:.0f} запросов/с, '
+            f'успешных пар {ok}, прочих {len(results) - ok}'
+        )
@@ -0,0 +1,148 @@
+import io
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image
+
+from recipes.management.commands.load_ingredients import batched
+from recipes.models import (Favorite, Follow, Ingredient, ReceiptTag, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag)
+
+User = get_user_model()
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+PASSWORD = 'bench-password'
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, рецептами, '
+            'подписками, избранным и корзинами для бенчмарков.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes-per-author', type=int, default=10)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--follow-density', type=float, default=0.05,
+                            help='Доля авторов, на которых подписан '
+                                 'каждый пользователь.')
+        parser.add_argument('--favorite-density', type=float, default=0.02)
+        parser.add_argument('--cart-density', type=float, default=0.01)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rng = random.Random(options['seed'])
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=self.stdout)
+        with transaction.atomic():
+            tags = self.create_tags()
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(
+                users, options['recipes_per_author']
+            )
+            self.fill_recipes(
+                rng, recipes, tags, options['ingredients_per_recipe']
+            )
+            self.create_links(rng, users, recipes, options)
+        call_command('recount', stdout=self.stdout)
+        call_command('update_search_vectors', stdout=self.stdout)
+        call_command('rebuild_feed', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('update_trending', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей {len(users)}, рецептов {len(recipes)} '
+            f'за {time.perf_counter() - start:.1f} с'
+        ))
+
+    def create_tags(self):
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        # Номер продолжает уже созданных, чтобы не упереться в unique.
+        offset = User.objects.filter(username__startswith='bench').count()
+        password = make_password(PASSWORD)
+        names = [f'bench{offset + i}' for i in range(count)]
+        for batch in batched(names, BATCH_SIZE):
+            User.objects.bulk_create(
+                User(username=name, email=f'{name}@bench.local',
+                     password=password, first_name='Bench', last_name=name)
+                for name in batch
+            )
+        return list(User.objects.filter(
+            username__in=names
+        ).values_list('id', flat=True))
+
+    def create_recipes(self, authors, per_author):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), (230, 160, 60)).save(buffer, 'JPEG')
+        image = default_storage.save(
+            'recipes/images/bench.jpg', ContentFile(buffer.getvalue())
+        )
+        rows = (
+            Recipe(author_id=author, name=f'Рецепт {n}',
+                   text='Синтетический рецепт для бенчмарка.',
+                   cooking_time=10 + n, image=image)
+            for author in authors for n in range(per_author)
+        )
+        for batch in batched(rows, BATCH_SIZE):
+            Recipe.objects.bulk_create(batch)
+        return list(Recipe.objects.filter(
+            author_id__in=authors
+        ).values_list('id', flat=True))
+
+    def fill_recipes(self, rng, recipes, tags, per_recipe):
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        per_recipe = min(per_recipe, len(ingredients))
+        rows = (
+            RecipeIngredient(recipe_id=recipe, ingredient_id=ingredient,
+                             amount=rng.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rng.sample(ingredients, per_recipe)
+        )
+        for batch in batched(rows, BATCH_SIZE):
+            RecipeIngredient.objects.bulk_create(batch)
+        rows = (
+            ReceiptTag(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, rng.randint(1, len(tags)))
+        )
+        for batch in batched(rows, BATCH_SIZE):
+            ReceiptTag.objects.bulk_create(batch)
+
+    def create_links(self, rng, users, recipes, options):
+        def pick(population, density):
+            return rng.sample(
+                population, min(len(population),
+                                round(len(population) * density))
+            )
+
+        links = (
+            (Follow, 'author_id', users, options['follow_density']),
+            (Favorite, 'recipe_id', recipes, options['favorite_density']),
+            (ShoppingCart, 'recipe_id', recipes, options['cart_density']),
+        )
+        for model, field, population, density in links:
+            rows = (
+                model(user_id=user, **{field: target})
+                for user in users
+                for target in pick(population, density)
+                if not (model is Follow and target == user)
+            )
+            for batch in batched(rows, BATCH_SIZE):
+                model.objects.bulk_create(batch, ignore_conflicts=True)
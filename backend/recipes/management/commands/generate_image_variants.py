@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Готовит уменьшенные копии картинок для уже загруженных рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии и для рецептов, где они уже есть.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        done = 0
+        for recipe_id, image_name in list(
+                recipes.values_list('id', 'image')
+        ):
+            generate_variants(recipe_id, image_name)
+            done += 1
+        self.stdout.write(self.style.SUCCESS(f'Обработано рецептов: {done}'))
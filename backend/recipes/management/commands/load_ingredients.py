@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import Ingredient
+from recipes.search import bump_version
+
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(settings.BASE_DIR), 'data', 'ingredients.csv'
+)
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(fp):
+    """Отдаёт объекты JSON-массива по одному, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if buffer.startswith('['):
+                buffer = buffer[1:]
+                started = True
+                continue
+        elif buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        elif buffer.startswith(']'):
+            return
+        elif buffer:
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                buffer = buffer[end:]
+                yield obj
+                continue
+        if eof:
+            if buffer.strip():
+                raise CommandError('Файл JSON оборван.')
+            return
+        chunk = fp.read(CHUNK_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_csv(fp):
+    for row in csv.reader(fp):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def iter_json(fp):
+    for obj in iter_json_array(fp):
+        if 'model' in obj:
+            # Фикстура Django: берём только ингредиенты.
+            if obj['model'] != 'recipes.ingredient':
+                continue
+            obj = obj['fields']
+        name = obj.get('name', obj.get('title'))
+        unit = obj.get('measurement_unit', obj.get('dimension'))
+        if name and unit is not None:
+            yield name, unit
+
+
+def iter_rows(path):
+    with open(path, encoding='utf-8') as fp:
+        reader = iter_json if path.endswith('.json') else iter_csv
+        for name, unit in reader(fp):
+            yield name.strip(), unit.strip()
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV, JSON или фикстур пачками. '
+            'Повторный запуск не создаёт дублей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=[DEFAULT_PATH])
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL.'
+        )
+
+    def handle(self, *args, **options):
+        use_copy = (connection.vendor == 'postgresql'
+                    and not options['no_copy'])
+        before = Ingredient.objects.count()
+        start = time.perf_counter()
+        total = 0
+        with transaction.atomic():
+            for path in options['paths']:
+                if not os.path.exists(path):
+                    raise CommandError(f'Файл {path} не найден.')
+                rows = iter_rows(path)
+                if use_copy:
+                    read = self.copy(rows, options['batch_size'])
+                else:
+                    read = self.bulk_create(rows, options['batch_size'])
+                total += read
+                self.stdout.write(f'{path}: прочитано строк {read}')
+        elapsed = time.perf_counter() - start
+        created = Ingredient.objects.count() - before
+        bump_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено {created} из {total} за {elapsed:.2f} с '
+            f'({total / elapsed if elapsed else total:.0f} строк/с)'
+        ))
+
+    def bulk_create(self, rows, batch_size):
+        read = 0
+        for batch in batched(rows, batch_size):
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in batch),
+                ignore_conflicts=True
+            )
+            read += len(batch)
+        return read
+
+    def copy(self, rows, batch_size):
+        table = Ingredient._meta.db_table
+        read = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_load '
+                '(name varchar(200), measurement_unit varchar(20))'
+            )
+            for batch in batched(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_load FROM STDIN WITH (FORMAT csv, '
+                    'FORCE_NOT_NULL (name, measurement_unit))',
+                    buffer
+                )
+                read += len(batch)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit FROM ingredient_load '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            cursor.execute('DROP TABLE ingredient_load')
+        return read
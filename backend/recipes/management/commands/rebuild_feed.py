@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает ленты подписок из Follow и Recipe. Нужен после '
+            'массовой загрузки в обход сигналов и после смены '
+            'FEED_FANOUT_LIMIT.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='id пользователя, можно несколько раз.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        written = feed.rebuild(options['user'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {written}'
+        ))
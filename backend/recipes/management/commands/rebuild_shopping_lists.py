@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import shopping_list
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает списки покупок из корзин. Нужен после массовой '
+            'загрузки в обход сигналов и при подозрении на расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='id пользователя, можно несколько раз.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        shopping_list.rebuild(options['user'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Строк в списках покупок: {ShoppingListItem.objects.count()}'
+        ))
@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart
+
+User = get_user_model()
+
+
+def count_by(model, field):
+    """Подзапрос числа строк model, ссылающихся на внешний объект."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики рецептов и пользователей.'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.update(
+            favorites_count=count_by(Favorite, 'recipe'),
+            in_carts_count=count_by(ShoppingCart, 'recipe'),
+        )
+        users = User.objects.update(
+            recipes_count=count_by(Recipe, 'author'),
+            followers_count=count_by(Follow, 'author'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано: рецептов {recipes}, пользователей {users}'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает поисковые векторы рецептов. Нужен после '
+            'массовой загрузки в обход сигналов (bulk_create, SQL).')
+
+    def handle(self, *args, **options):
+        updated = Recipe.objects.update_search_vector()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено поисковых векторов: {updated}'
+        ))
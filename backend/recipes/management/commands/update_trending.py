@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes import trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает популярность рецептов по добавлениям в '
+            'избранное и корзину за TRENDING_WINDOW_DAYS. Запускайте '
+            'периодически, например из cron раз в 15 минут.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        scored = trending.update_scores()
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярность пересчитана для {scored} рецептов '
+            f'за {time.perf_counter() - start:.2f} с'
+        ))
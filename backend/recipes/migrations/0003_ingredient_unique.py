@@ -0,0 +1,70 @@
+# Generated by Django 3.2.4 on 2026-10-18 05:50
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Сливает одинаковые ингредиенты и повторы ингредиента в рецепте.
+
+    Рецепты переводятся на ингредиент с меньшим id, а если он в рецепте
+    уже есть, количества складываются.
+    """
+    postgresql = schema_editor.connection.vendor == 'postgresql'
+    if postgresql:
+        # Иначе отложенные проверки внешних ключей не дадут добавить
+        # ограничения в той же транзакции.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), copies=Count('id')).filter(copies__gt=1)
+    for row in duplicates:
+        extra = list(Ingredient.objects.filter(
+            name=row['name'], measurement_unit=row['measurement_unit']
+        ).exclude(id=row['keep']).values_list('id', flat=True))
+        RecipeIngredient.objects.filter(ingredient__in=extra).update(
+            ingredient=row['keep']
+        )
+        Ingredient.objects.filter(id__in=extra).delete()
+    repeated = RecipeIngredient.objects.values(
+        'recipe', 'ingredient'
+    ).annotate(
+        keep=Min('id'), copies=Count('id'), total=Sum('amount')
+    ).filter(copies__gt=1)
+    for row in repeated:
+        RecipeIngredient.objects.filter(id=row['keep']).update(
+            amount=row['total']
+        )
+        RecipeIngredient.objects.filter(
+            recipe=row['recipe'], ingredient=row['ingredient']
+        ).exclude(id=row['keep']).delete()
+    if postgresql:
+        schema_editor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(max_length=200, verbose_name='Имя ингредиента'),
+        ),
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('ingredient', 'recipe'), name='recipe_ingredient_unique'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.4 on 2026-10-18 06:03
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+# GIN-индекс и tsvector есть только в PostgreSQL: на SQLite колонка
+# остаётся пустой, а поиск идёт на Python.
+CREATE_INDEX = (
+    'CREATE INDEX recipe_search_idx ON recipes_recipe '
+    'USING gin (search_vector)'
+)
+DROP_INDEX = 'DROP INDEX IF EXISTS recipe_search_idx'
+FILL = '''
+UPDATE recipes_recipe SET search_vector =
+    setweight(to_tsvector(%(config)s, coalesce(name, '')), 'A')
+    || setweight(to_tsvector(%(config)s, coalesce(text, '')), 'B')
+    || setweight(to_tsvector(%(config)s, coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM recipes_recipeingredient link
+        JOIN recipes_ingredient ingredient
+            ON ingredient.id = link.ingredient_id
+        WHERE link.recipe_id = recipes_recipe.id
+    ), '')), 'C')
+'''
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_INDEX)
+    schema_editor.execute(FILL, {'config': settings.SEARCH_CONFIG})
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.4 on 2026-10-18 06:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    tables = {
+        name: apps.get_model('recipes', model)._meta.db_table
+        for name, model in (('item', 'ShoppingListItem'),
+                            ('cart', 'ShoppingCart'),
+                            ('link', 'RecipeIngredient'))
+    }
+    schema_editor.execute(
+        'INSERT INTO {item} (user_id, ingredient_id, amount) '
+        'SELECT cart.user_id, link.ingredient_id, SUM(link.amount) '
+        'FROM {cart} cart JOIN {link} link '
+        'ON link.recipe_id = cart.recipe_id '
+        'GROUP BY cart.user_id, link.ingredient_id'.format(**tables)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_feed_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Список покупок',
+                'verbose_name_plural': 'Список покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.4 on 2026-10-18 06:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Min
+
+
+def delete_duplicate_tags(apps, schema_editor):
+    ReceiptTag = apps.get_model('recipes', 'ReceiptTag')
+    duplicates = ReceiptTag.objects.values('recipe', 'tag').annotate(
+        keep=Min('id'), copies=Count('id')
+    ).filter(copies__gt=1)
+    for row in duplicates:
+        ReceiptTag.objects.filter(
+            recipe=row['recipe'], tag=row['tag']
+        ).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_shopping_list_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_duplicate_tags, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='receipttag',
+            constraint=models.UniqueConstraint(fields=('tag', 'recipe'), name='unique_recipe_tag'),
+        ),
+        migrations.AlterField(
+            model_name='receipttag',
+            name='tag',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='recipes.tag'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-added_date'], name='favorite_user_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['user', '-created_at'], name='follow_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['name', 'pub_date'], name='recipe_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['user', '-added_date'], name='cart_user_added_idx'),
+        ),
+    ]
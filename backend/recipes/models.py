@@ -1,9 +1,20 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import (Case, Exists, F, OuterRef, Prefetch, Subquery,
+                              Value, When, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 
 User = get_user_model()
 
+# Веса частей рецепта в поиске: те же, что у ts_rank для A, B и C.
+SEARCH_WEIGHTS = (('name', 1.0), ('text', 0.4), ('ingredients', 0.2))
+
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -17,6 +28,12 @@ class Ingredient(models.Model):
         ordering = ['name', ]
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient',
+            )
+        ]
 
     def __str__(self):
         return f'{self.name} {self.measurement_unit}'
@@ -36,6 +53,147 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        """Аннотирует is_favorited и is_in_shopping_cart для user."""
+        if user is None or user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+    def for_show(self, user):
+        """Всё, что нужно ShowRecipeSerializer, за постоянное число запросов.
+
+        Флаги пользователя считаются подзапросами Exists, авторы, теги и
+        ингредиенты подгружаются по одному запросу на страницу.
+        """
+        authors = User.objects.all()
+        if user is not None and user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        return self.with_user_flags(user).prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )
+
+    def latest_per_author(self, limit):
+        """Не больше limit последних рецептов каждого автора.
+
+        ROW_NUMBER() считается по текущей выборке, а фильтр по нему
+        вынесен во внешний запрос: Django 3.2 не умеет фильтровать
+        по оконным функциям.
+        """
+        ranked = self.order_by().annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )).values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.filter(id__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            f'WHERE ranked.row_number <= %s',
+            (*params, limit)
+        )).order_by('-pub_date', '-id')
+
+    def update_search_vector(self):
+        """Пересчитывает search_vector одним UPDATE.
+
+        Название идёт с весом A, описание — B, ингредиенты — C. Вне
+        PostgreSQL вектор не хранится, поиск считается на Python.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        config = settings.SEARCH_CONFIG
+        ingredients = RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector('text', weight='B', config=config)
+            + SearchVector(Subquery(ingredients), weight='C', config=config)
+        ))
+
+    def popular(self):
+        """Рецепты с недавней активностью, самые популярные первыми."""
+        return self.filter(score__isnull=False).order_by(
+            '-score__score', '-id'
+        )
+
+    def search(self, query):
+        """Рецепты, подходящие под query, от самых релевантных.
+
+        В PostgreSQL запрос разбирается как websearch_to_tsquery и ищется
+        по GIN-индексу search_vector, ранг — ts_rank.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return self.search_in_python(query)
+        query = SearchQuery(
+            query, config=settings.SEARCH_CONFIG, search_type='websearch'
+        )
+        return self.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', '-id')
+
+    def search_in_python(self, query):
+        """Запасной поиск для SQLite: подстроки вместо словоформ.
+
+        Каждое слово запроса должно найтись в названии, описании или
+        ингредиентах, ранг — сумма весов мест, где оно нашлось.
+        """
+        def normalize(text):
+            return text.lower().replace('ё', 'е')
+
+        terms = normalize(query).split()
+        if not terms:
+            return self.none()
+        ingredients = {}
+        for recipe_id, name in RecipeIngredient.objects.filter(
+            recipe__in=self.values('pk')
+        ).values_list('recipe_id', 'ingredient__name'):
+            ingredients.setdefault(recipe_id, []).append(normalize(name))
+        ranks = {}
+        for recipe_id, name, text in self.order_by().values_list(
+            'id', 'name', 'text'
+        ):
+            fields = {
+                'name': normalize(name),
+                'text': normalize(text),
+                'ingredients': ' '.join(ingredients.get(recipe_id, ())),
+            }
+            scores = [
+                max((weight for field, weight in SEARCH_WEIGHTS
+                     if term in fields[field]), default=0)
+                for term in terms
+            ]
+            if all(scores):
+                ranks[recipe_id] = sum(scores)
+        if not ranks:
+            return self.none()
+        return self.filter(pk__in=ranks).annotate(rank=Case(
+            *(When(pk=pk, then=Value(rank)) for pk, rank in ranks.items()),
+            output_field=models.FloatField()
+        )).order_by('-rank', '-pub_date', '-id')
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -51,6 +209,12 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Изображение',
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения'
+    )
     text = models.TextField(
         max_length=128,
         verbose_name='Описание рецепта'
@@ -69,11 +233,41 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        db_index=True,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('name', 'pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_feed_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_feed_idx'
+            ),
+            models.Index(
+                fields=['name', 'pub_date'], name='recipe_name_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.author}: {self.name}'
@@ -107,11 +301,17 @@ class RecipeIngredient(models.Model):
 
 class ReceiptTag(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
-    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    # Индекс по тегу — начало unique_recipe_tag.
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False)
 
     class Meta:
         verbose_name = 'Теги'
         verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tag', 'recipe'], name='unique_recipe_tag'
+            )
+        ]
 
 
 class Follow(models.Model):
@@ -140,6 +340,11 @@ class Follow(models.Model):
                 fields=['user', 'author'], name='unique_follow'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at'], name='follow_user_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} following {self.author}'
@@ -167,6 +372,14 @@ class Favorite(models.Model):
                 fields=['user', 'recipe'], name='unique_favorite'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', '-added_date'], name='favorite_user_added_idx'
+            ),
+            models.Index(
+                fields=['added_date', 'recipe'], name='favorite_added_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} added {self.recipe}'
@@ -197,6 +410,116 @@ class ShoppingCart(models.Model):
             models.UniqueConstraint(
                 fields=['user', 'recipe'], name='unique_shopping_cart'
             )]
+        indexes = [
+            models.Index(
+                fields=['user', '-added_date'], name='cart_user_added_idx'
+            ),
+            models.Index(
+                fields=['added_date', 'recipe'], name='cart_added_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} added {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Сколько ингредиента нужно по всей корзине пользователя.
+
+    Меняется вместе с корзиной и составом рецептов в ней, поэтому список
+    покупок читается готовым. Расхождения чинит rebuild_shopping_lists.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Список покупок'
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика, записывается при публикации.
+
+    pub_date копируется из рецепта, чтобы страница ленты читалась
+    одним проходом по индексу (user, -pub_date, -recipe).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_page_idx'
+            ),
+        ]
+
+
+class RecipeScore(models.Model):
+    """Популярность рецепта за последнее время.
+
+    Считается пачкой командой update_trending по недавним добавлениям
+    в избранное и корзину с затуханием, чтобы сортировка по
+    популярности шла по индексу, а не по COUNT на каждый запрос.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField(verbose_name='Популярность')
+    computed_at = models.DateTimeField(verbose_name='Дата расчёта')
+
+    class Meta:
+        verbose_name = 'Популярность'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(
+                fields=['-score', '-recipe'], name='recipe_score_idx'
+            ),
+        ]
@@ -1,5 +1,87 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
 
 class CustomPageNumberPaginator(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPaginator(CursorPagination):
+    """Курсорная пагинация по индексу (-pub_date, -id).
+
+    Любая страница стоит как первая. count приблизительный: без
+    фильтров берётся из статистики PostgreSQL, с фильтрами — из кэша.
+    Фильтры со своей сортировкой (популярность, релевантность поиска)
+    с курсором несовместимы: курсор заменил бы их порядок датой.
+    """
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+    count_cache_timeout = 60
+    user_filters = ('is_favorited', 'is_in_shopping_cart')
+    ordering_filters = ('ordering', 'search')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        conflicts = [key for key in self.ordering_filters
+                     if key in request.query_params]
+        if conflicts:
+            raise ValidationError({'pagination': [
+                f'Курсорная пагинация идёт по дате публикации и не '
+                f'сочетается с {", ".join(conflicts)}: используйте '
+                f'page и limit.'
+            ]})
+        self.count = self.get_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_filter_params(self, request):
+        skip = {self.cursor_query_param, self.page_size_query_param,
+                'pagination'}
+        return sorted(
+            (key, sorted(values))
+            for key, values in request.query_params.lists()
+            if key not in skip
+        )
+
+    def get_count(self, queryset, request):
+        params = self.get_filter_params(request)
+        if not params:
+            estimate = self.estimate_table_count(queryset)
+            if estimate is not None:
+                return estimate
+        if any(key in self.user_filters for key, _ in params):
+            params.append(('user', request.user.pk))
+        digest = hashlib.md5(repr(params).encode()).hexdigest()
+        key = f'recipe_count:{digest}'
+        count = cache.get(key)
+        if count is None:
+            count = queryset.order_by().count()
+            cache.set(key, count, self.count_cache_timeout)
+        return count
+
+    def estimate_table_count(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        # До первого ANALYZE reltuples равен -1 (или 0 на старых версиях).
+        if row is None or row[0] <= 0:
+            return None
+        return int(row[0])
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
@@ -0,0 +1,26 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class ExportRenderer(BaseRenderer):
+    """Отдаёт готовые байты файла; формат выбирается по ?format=."""
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class TxtRenderer(ExportRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+
+class CsvRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+
+class PdfRenderer(ExportRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
@@ -0,0 +1,200 @@
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Ingredient
+
+VERSION_KEY = 'ingredient_index_version'
+
+RANK_PREFIX = 0
+RANK_WORD_PREFIX = 1
+RANK_SUBSTRING = 2
+RANK_FUZZY = 3
+
+MIN_SIMILARITY = 0.3
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е').strip()
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+_version = None
+_version_checked_at = None
+
+
+def remember_version(version):
+    global _version, _version_checked_at
+    _version, _version_checked_at = version, time.monotonic()
+    return version
+
+
+def bump_version():
+    """Помечает индекс устаревшим во всех процессах.
+
+    Версия лежит в общем кэше (CACHES), каждый воркер сверяется с ней
+    не чаще раза в INGREDIENT_INDEX_VERSION_CHECK секунд. Меняется после
+    коммита, иначе другой процесс успел бы собрать индекс по старым
+    данным уже под новой версией.
+    """
+    def publish():
+        version = uuid.uuid4().hex
+        cache.set(VERSION_KEY, version, None)
+        remember_version(version)
+
+    transaction.on_commit(publish)
+
+
+def get_version():
+    checked_at = _version_checked_at
+    if (checked_at is not None and time.monotonic() - checked_at
+            < settings.INGREDIENT_INDEX_VERSION_CHECK):
+        return _version
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(VERSION_KEY, version, None)
+        version = cache.get(VERSION_KEY, version)
+    return remember_version(version)
+
+
+class _TrieNode:
+    __slots__ = ('children', 'entries')
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []
+
+
+class IngredientIndex:
+    """Поисковый индекс ингредиентов в памяти процесса.
+
+    Префиксное дерево хранит в каждом узле лучшие limit записей, поэтому
+    поиск по префиксу стоит O(длина запроса). Триграммы нужны для поиска
+    подстроки и для запросов с опечатками.
+    """
+
+    def __init__(self, rows, limit):
+        self.limit = limit
+        self.rows = []
+        self.names = []
+        self.gram_counts = []
+        self.root = _TrieNode()
+        self.postings = {}
+        for ingredient_id, name, measurement_unit in rows:
+            self.add(ingredient_id, name, measurement_unit)
+        self._finalize(self.root)
+
+    def add(self, ingredient_id, name, measurement_unit):
+        position = len(self.rows)
+        normalized = normalize(name)
+        self.rows.append({
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': measurement_unit,
+        })
+        self.names.append(normalized)
+        start = 0
+        for word in normalized.split():
+            start = normalized.index(word, start)
+            rank = RANK_PREFIX if start == 0 else RANK_WORD_PREFIX
+            entry = (rank, len(normalized), normalized, position)
+            node = self.root
+            for char in normalized[start:]:
+                node = node.children.setdefault(char, _TrieNode())
+                node.entries.append(entry)
+            start += len(word)
+        grams = trigrams(normalized)
+        self.gram_counts.append(len(grams))
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(position)
+
+    def _finalize(self, root):
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            best, seen = [], set()
+            for entry in sorted(node.entries):
+                if entry[3] not in seen:
+                    seen.add(entry[3])
+                    best.append(entry)
+                    if len(best) == self.limit:
+                        break
+            node.entries = best
+            stack.extend(node.children.values())
+
+    def search(self, query, limit=None):
+        limit = min(limit or self.limit, self.limit)
+        query = normalize(query)
+        if not query:
+            return []
+        found = self._prefix(query)
+        if len(found) < limit and len(query) >= 3:
+            found += self._fuzzy(query, {entry[3] for entry in found})
+        return [self.rows[entry[3]] for entry in found[:limit]]
+
+    def _prefix(self, query):
+        node = self.root
+        for char in query:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return list(node.entries)
+
+    def _fuzzy(self, query, exclude):
+        query_grams = trigrams(query)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+        found = []
+        for position, common in shared.items():
+            if position in exclude:
+                continue
+            name = self.names[position]
+            if query in name:
+                key = (RANK_SUBSTRING, 0)
+            else:
+                similarity = common / (
+                    len(query_grams) + self.gram_counts[position] - common
+                )
+                if similarity < MIN_SIMILARITY:
+                    continue
+                key = (RANK_FUZZY, -similarity)
+            found.append((key, len(name), name, position))
+        found.sort()
+        return [(key[0], length, name, position)
+                for key, length, name, position in found]
+
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def get_index():
+    global _index, _index_version
+    version = get_version()
+    if _index is None or _index_version != version:
+        with _lock:
+            if _index is None or _index_version != version:
+                rows = Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'
+                ).order_by('id')
+                _index = IngredientIndex(
+                    rows.iterator(), settings.INGREDIENT_SEARCH_LIMIT
+                )
+                _index_version = version
+    return _index
+
+
+def search_ingredients(query, limit=None):
+    return get_index().search(query, limit)
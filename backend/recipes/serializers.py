@@ -1,10 +1,12 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
 from rest_framework import serializers
-from rest_framework.generics import get_object_or_404
 
 from users.serializers import UserDetailSerializer
-from .fields import Base64ImageField
+from . import shopping_list
+from .fields import Base64ImageField, ImageVariantsField
+from .images import schedule_variants
 from .models import (
     Tag,
     Ingredient,
@@ -21,6 +23,7 @@ User = get_user_model()
 
 class ShowRecipeAddedSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -28,6 +31,7 @@ class ShowRecipeAddedSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
         read_only_fields = fields
@@ -95,7 +99,7 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
 
 
 class AddIngredientToRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -112,6 +116,7 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
     ingredients = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -124,15 +129,18 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time'
         )
 
     def get_ingredients(self, obj):
-        record = RecipeIngredient.objects.filter(recipe=obj)
+        record = obj.recipeingredient_set.all()
         return IngredientInRecipeSerializer(record, many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
@@ -140,6 +148,8 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
         return Favorite.objects.filter(recipe=obj, user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
@@ -147,6 +157,23 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
         return ShoppingCart.objects.filter(recipe=obj, user=user).exists()
 
 
+DELETE_LINKS = (
+    'DELETE FROM {table} WHERE recipe_id = %s AND {column} IN ({ids})'
+)
+
+
+def delete_links(model, field, recipe, ids):
+    """DELETE одним запросом, без выборки строк и сигналов на каждую."""
+    ids = list(ids)
+    sql = DELETE_LINKS.format(
+        table=model._meta.db_table,
+        column=model._meta.get_field(field).column,
+        ids=shopping_list.placeholders(ids)
+    )
+    with connections[router.db_for_write(model)].cursor() as cursor:
+        cursor.execute(sql, [recipe.id, *ids])
+
+
 class CreateRecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField(
         max_length=300,
@@ -193,6 +220,18 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                 )
         return data
 
+    def validate_ingredients(self, data):
+        ids = {item['id'] for item in data}
+        found = set(Ingredient.objects.filter(
+            id__in=ids
+        ).values_list('id', flat=True))
+        missing = ids - found
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing)}'
+            )
+        return data
+
     def validate_cooking_time(self, data):
         if data <= 0:
             raise serializers.ValidationError(
@@ -200,126 +239,116 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             )
         return data
 
+    @staticmethod
+    def set_tags(recipe, tags, existing=()):
+        tag_ids = {tag.id for tag in tags}
+        existing = set(existing)
+        removed = existing - tag_ids
+        if removed:
+            delete_links(ReceiptTag, 'tag', recipe, removed)
+        ReceiptTag.objects.bulk_create(
+            ReceiptTag(recipe=recipe, tag_id=tag_id)
+            for tag_id in tag_ids - existing
+        )
+
+    @staticmethod
+    def set_ingredients(recipe, ingredients, existing=()):
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        current = {row.ingredient_id: row for row in existing}
+        removed = current.keys() - amounts.keys()
+        if removed:
+            delete_links(RecipeIngredient, 'ingredient', recipe, removed)
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        )
+        if current:
+            # Все правки идут в обход сигналов: списки покупок
+            # пересчитываются один раз по всем затронутым ингредиентам,
+            # вектор поиска и фрагмент обновит сохранение рецепта.
+            shopping_list.refresh(recipe.id, [
+                *removed,
+                *(row.ingredient_id for row in changed),
+                *(amounts.keys() - current.keys()),
+            ])
+
+    @transaction.atomic
     def create(self, validated_data):
         tags_data = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredients')
         author = self.context.get('request').user
         recipe = Recipe.objects.create(author=author, **validated_data)
-        for ingredient in ingredients_data:
-            ingredient_model = ingredient['id']
-            amount = ingredient['amount']
-            RecipeIngredient.objects.create(
-                ingredient=ingredient_model,
-                recipe=recipe,
-                amount=amount
-            )
-        for tag in tags_data:
-            ReceiptTag.objects.create(recipe=recipe, tag=tag)
+        self.set_ingredients(recipe, ingredients_data)
+        self.set_tags(recipe, tags_data)
+        schedule_variants(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags_data = validated_data.pop('tags')
         ingredient_data = validated_data.pop('ingredients')
-        ReceiptTag.objects.filter(recipe=instance).delete()
-        for tag in tags_data:
-            ReceiptTag.objects.create(
-                recipe=instance,
-                tag=tag
-            )
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        for new_ingredient in ingredient_data:
-            RecipeIngredient.objects.create(
-                ingredient=new_ingredient['id'],
-                recipe=instance,
-                amount=new_ingredient['amount']
-            )
+        self.set_tags(
+            instance,
+            tags_data,
+            ReceiptTag.objects.filter(
+                recipe=instance
+            ).values_list('tag_id', flat=True)
+        )
+        self.set_ingredients(
+            instance,
+            ingredient_data,
+            RecipeIngredient.objects.filter(recipe=instance)
+        )
         instance.name = validated_data.pop('name')
         instance.text = validated_data.pop('text')
-        if validated_data.get('image') is not None:
-            instance.image = validated_data.pop('image')
+        image = validated_data.pop('image', None)
+        if image is not None:
+            instance.image = image
         instance.cooking_time = validated_data.pop('cooking_time')
         instance.save()
+        if image is not None:
+            schedule_variants(instance)
         return instance
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.for_show(request.user).get(pk=instance.pk)
         data = ShowRecipeSerializer(
             instance,
             context={
-                'request': self.context.get('request')
+                'request': request
             }
         ).data
         return data
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    recipe = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all())
-    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
-
-    class Meta:
-        model = Favorite
-        fields = (
-            'user',
-            'recipe'
-        )
-
-    def validate(self, data):
-        user = self.context.get('request').user
-        recipe_id = data['recipe'].id
-
-        if (self.context.get('request').method == 'GET'
-                and Favorite.objects.filter(user=user,
-                                            recipe__id=recipe_id).exists()):
-            raise serializers.ValidationError(
-                'Рецепт уже добавлен в избранное')
-
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-
-        if (self.context.get('request').method == 'DELETE'
-                and not Favorite.objects.filter(
-                    user=user,
-                    recipe=recipe).exists()):
-            raise serializers.ValidationError()
-
-        return data
-
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        context = {'request': request}
-        return ShowRecipeAddedSerializer(
-            instance.recipe,
-            context=context).data
-
-
-class ShoppingCartSerializer(FavoriteSerializer):
-    class Meta(FavoriteSerializer.Meta):
-        model = ShoppingCart
-
-    def validate(self, data):
-        user = self.context.get('request').user
-        recipe_id = data['recipe'].id
-        if (self.context.get('request').method == 'GET'
-                and ShoppingCart.objects.filter(
-                    user=user,
-                    recipe__id=recipe_id
-                ).exists()):
-            raise serializers.ValidationError(
-                'Продукты уже в корзине')
-
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-
-        if (self.context.get('request').method == 'DELETE'
-                and not ShoppingCart.objects.filter(
-                    user=user,
-                    recipe=recipe).exists()):
-            raise serializers.ValidationError()
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_SIZE
+    )
 
-        return data
+    def validate_recipes(self, data):
+        return list(dict.fromkeys(data))
 
 
 class ShowFollowSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -335,53 +364,22 @@ class ShowFollowSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        return obj.follower.filter(user=obj, author=request.user).exists()
+        return Follow.objects.filter(user=request.user, author=obj).exists()
 
     def get_recipes(self, obj):
-        recipes = obj.recipes.all()[:settings.RECIPES_LIMIT]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            limit = self.context.get('recipes_limit', settings.RECIPES_LIMIT)
+            recipes = obj.recipes.all()[:limit]
         request = self.context.get('request')
         context = {'request': request}
         return ShowRecipeAddedSerializer(
             recipes,
             many=True,
             context=context).data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
-
-class FollowSerializer(serializers.ModelSerializer):
-    queryset = User.objects.all()
-    user = serializers.PrimaryKeyRelatedField(queryset=queryset)
-    author = serializers.PrimaryKeyRelatedField(queryset=queryset)
-
-    class Meta:
-        model = Follow
-        fields = (
-            'user',
-            'author'
-        )
-
-    def validate(self, data):
-        user = self.context.get('request').user
-        author_id = data['author'].id
-        follow_exist = Follow.objects.filter(
-            user=user,
-            author__id=author_id
-        ).exists()
-
-        if self.context.get('request').method == 'GET':
-            if user.id == author_id or follow_exist:
-                raise serializers.ValidationError(
-                    'Подписка существует')
-        return data
-
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        context = {'request': request}
-        return ShowFollowSerializer(
-            instance.author,
-            context=context).data
@@ -0,0 +1,195 @@
+from django.db import connections, router
+from django.db.models import Case, F, IntegerField, Max, Min, Sum, Value, When
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+# Единица -> (величина, сколько базовых единиц в ней). Базовые — г и мл.
+UNITS = {
+    'г': ('масса', 1),
+    'кг': ('масса', 1000),
+    'мл': ('объём', 1),
+    'л': ('объём', 1000),
+    'ч. л.': ('объём', 5),
+    'ст. л.': ('объём', 15),
+    'стакан': ('объём', 250),
+}
+# Во что переводить сумму при выводе, от крупной единицы к мелкой.
+DISPLAY_UNITS = {
+    'масса': (('кг', 1000), ('г', 1)),
+    'объём': (('л', 1000), ('мл', 1)),
+}
+
+UNIT_FIELD = 'ingredient__measurement_unit'
+
+
+def unit_case(values, default, output_field=None):
+    return Case(
+        *(When(**{UNIT_FIELD: unit}, then=Value(value))
+          for unit, value in values.items()),
+        default=default,
+        output_field=output_field,
+    )
+
+
+def aggregate(rows):
+    """Суммирует строки с ingredient и amount одним GROUP BY.
+
+    Строки группируются по продукту и величине: граммы с килограммами
+    и миллилитры с литрами и ложками складываются в базовых единицах
+    прямо в базе. Остальные единицы (шт., по вкусу) сами себе величина.
+    """
+    return (
+        rows
+        .annotate(
+            dimension=unit_case(
+                {unit: dimension for unit, (dimension, _) in UNITS.items()},
+                F(UNIT_FIELD),
+            ),
+            base=F('amount') * unit_case(
+                {unit: factor for unit, (_, factor) in UNITS.items()},
+                Value(1), IntegerField(),
+            ),
+        )
+        .values('ingredient__name', 'dimension')
+        .annotate(
+            amount=Sum('amount'),
+            base_amount=Sum('base'),
+            first_unit=Min(UNIT_FIELD),
+            last_unit=Max(UNIT_FIELD),
+        )
+        .order_by('ingredient__name', 'dimension')
+    )
+
+
+def get_shopping_list(user):
+    """Список покупок из готовых сумм ShoppingListItem."""
+    return aggregate(ShoppingListItem.objects.filter(user=user))
+
+
+def get_cart_ingredients(user):
+    """То же, но заново по корзине, без ShoppingListItem."""
+    return aggregate(
+        RecipeIngredient.objects.filter(recipe__shopping_cart__user=user)
+    )
+
+
+def format_number(value):
+    return f'{value:.2f}'.rstrip('0').rstrip('.').replace('.', ',')
+
+
+def readable(item):
+    """Количество и единица строки списка покупок для человека.
+
+    Одна кухонная единица (ложки, стакан) остаётся как есть, а г/мл и
+    смесь единиц одной величины переводятся в кг/л, если набралось.
+    """
+    unit = item['first_unit']
+    display = DISPLAY_UNITS.get(item['dimension'])
+    if display is None or (
+        unit == item['last_unit']
+        and unit not in dict(display)
+    ):
+        return str(item['amount']), unit
+    for unit, factor in display:
+        if item['base_amount'] >= factor:
+            break
+    return format_number(item['base_amount'] / factor), unit
+
+
+def iter_txt(items):
+    for item in items.iterator():
+        amount, unit = readable(item)
+        yield f'{item["ingredient__name"]} - {amount} {unit} \n'
+
+
+# Сопровождение ShoppingListItem. Запросы написаны так, чтобы работать
+# и в PostgreSQL, и в SQLite (INSERT ... ON CONFLICT DO UPDATE).
+ADD_RECIPES = '''
+INSERT INTO {item} (user_id, ingredient_id, amount)
+SELECT %s, ingredient_id, SUM(amount) * %s FROM {link}
+WHERE recipe_id IN ({recipes})
+GROUP BY ingredient_id
+ON CONFLICT (user_id, ingredient_id)
+DO UPDATE SET amount = {item}.amount + excluded.amount
+'''
+DROP_EMPTY = 'DELETE FROM {item} WHERE user_id = %s AND amount <= 0'
+REFILL = '''
+INSERT INTO {item} (user_id, ingredient_id, amount)
+SELECT cart.user_id, link.ingredient_id, SUM(link.amount)
+FROM {cart} cart JOIN {link} link ON link.recipe_id = cart.recipe_id
+WHERE {where}
+GROUP BY cart.user_id, link.ingredient_id
+'''
+
+
+def tables():
+    return {
+        'item': ShoppingListItem._meta.db_table,
+        'cart': ShoppingCart._meta.db_table,
+        'link': RecipeIngredient._meta.db_table,
+    }
+
+
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def change_recipes(user_id, recipe_ids, sign):
+    """Прибавляет (sign=1) или вычитает (sign=-1) рецепты из списка.
+
+    Вызывается там, где корзина меняется в обход сигналов ShoppingCart:
+    bulk_create и однооператорные переключатели.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    alias = router.db_for_write(ShoppingListItem)
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            ADD_RECIPES.format(recipes=placeholders(recipe_ids), **tables()),
+            [user_id, sign, *recipe_ids]
+        )
+        if sign < 0:
+            cursor.execute(DROP_EMPTY.format(**tables()), [user_id])
+
+
+def refill(where, params):
+    alias = router.db_for_write(ShoppingListItem)
+    with connections[alias].cursor() as cursor:
+        cursor.execute(REFILL.format(where=where, **tables()), params)
+
+
+def refresh(recipe_id, ingredient_ids):
+    """Пересчитывает ингредиенты рецепта у всех, у кого он в корзине.
+
+    Нужен, когда меняется состав рецепта: затронутые суммы собираются
+    заново только для этих пользователей и ингредиентов.
+    """
+    ingredient_ids = list(ingredient_ids)
+    if not ingredient_ids:
+        return
+    user_ids = list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True))
+    if not user_ids:
+        return
+    ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=ingredient_ids
+    ).delete()
+    refill(
+        f'cart.user_id IN ({placeholders(user_ids)})'
+        f' AND link.ingredient_id IN ({placeholders(ingredient_ids)})',
+        [*user_ids, *ingredient_ids]
+    )
+
+
+def rebuild(user_ids=None):
+    """Собирает ShoppingListItem заново из корзин."""
+    items = ShoppingListItem.objects.all()
+    if user_ids is None:
+        items.delete()
+        refill('TRUE', [])
+        return
+    user_ids = list(user_ids)
+    items.filter(user_id__in=user_ids).delete()
+    refill(f'cart.user_id IN ({placeholders(user_ids)})', user_ids)
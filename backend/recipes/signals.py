@@ -0,0 +1,172 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import feed, fragments, shopping_list
+from .filters import invalidate_tag_choices
+from .models import (Favorite, Follow, Ingredient, ReceiptTag, Recipe,
+                     RecipeIngredient, ShoppingCart, Tag)
+from .search import bump_version
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    bump_version()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_filter_choices(sender, **kwargs):
+    invalidate_tag_choices()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_fragment(sender, instance, **kwargs):
+    fragments.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=ReceiptTag)
+@receiver(post_delete, sender=ReceiptTag)
+def invalidate_recipe_fragment_by_row(sender, instance, **kwargs):
+    fragments.invalidate([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+def invalidate_recipe_fragments_by_related(sender, instance, created,
+                                           **kwargs):
+    if created:
+        return
+    field = 'ingredients' if sender is Ingredient else 'tags'
+    fragments.invalidate(Recipe.objects.filter(
+        **{field: instance}
+    ).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_fragments(sender, instance, created, update_fields,
+                                **kwargs):
+    if created or update_fields == frozenset(['last_login']):
+        return
+    fragments.invalidate(Recipe.objects.filter(
+        author=instance
+    ).values_list('id', flat=True))
+
+
+def update_search_vector(recipes):
+    """Пересчитывает вектор после коммита, когда ингредиенты уже записаны."""
+    transaction.on_commit(
+        lambda: Recipe.objects.filter(pk__in=recipes).update_search_vector()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, update_fields, **kwargs):
+    if update_fields and not {'name', 'text'} & update_fields:
+        return
+    update_search_vector([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def update_search_vector_by_row(sender, instance, **kwargs):
+    update_search_vector([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_search_vector_by_ingredient(sender, instance, created, **kwargs):
+    if created:
+        return
+    update_search_vector(Recipe.objects.filter(
+        ingredients=instance
+    ).values('pk'))
+
+
+def change_counter(model, pk, field, delta):
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def count_recipe_marks(sender, instance, **kwargs):
+    if kwargs.get('created') is False:
+        return
+    field = 'favorites_count' if sender is Favorite else 'in_carts_count'
+    delta = 1 if kwargs.get('created') else -1
+    change_counter(Recipe, instance.recipe_id, field, delta)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def count_author_recipes(sender, instance, **kwargs):
+    if kwargs.get('created') is False:
+        return
+    delta = 1 if kwargs.get('created') else -1
+    change_counter(User, instance.author_id, 'recipes_count', delta)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def count_followers(sender, instance, **kwargs):
+    if kwargs.get('created') is False:
+        return
+    delta = 1 if kwargs.get('created') else -1
+    change_counter(User, instance.author_id, 'followers_count', delta)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: feed.fan_out(instance))
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(
+            lambda: feed.backfill(instance.user_id, instance.author_id)
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def prune_feed(sender, instance, **kwargs):
+    feed.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def refill_feeds(sender, instance, **kwargs):
+    # Счётчик уже уменьшен в count_followers, строка автора заблокирована
+    # до коммита, поэтому переход порога видит ровно одна отписка.
+    followers = User.objects.filter(pk=instance.author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    if followers == settings.FEED_FANOUT_LIMIT:
+        transaction.on_commit(
+            lambda: feed.backfill_followers(instance.author_id)
+        )
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def update_shopping_list(sender, instance, **kwargs):
+    if kwargs.get('created') is False:
+        return
+    sign = 1 if kwargs.get('created') else -1
+    shopping_list.change_recipes(instance.user_id, [instance.recipe_id], sign)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def refresh_shopping_lists(sender, instance, **kwargs):
+    shopping_list.refresh(instance.recipe_id, [instance.ingredient_id])
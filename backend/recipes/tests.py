@@ -0,0 +1,403 @@
+import io
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from foodgram_project.profiling import query_budget
+from users.authentication import token_cache
+
+from .models import (Favorite, FeedEntry, Follow, Ingredient, ReceiptTag,
+                     Recipe, RecipeIngredient, RecipeScore, ShoppingCart,
+                     Tag)
+from .shopping_list import get_cart_ingredients, get_shopping_list
+
+User = get_user_model()
+
+# Счётчики запросов не должны зависеть от CACHES окружения.
+LOCAL_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class RecipeAPITestCase(TestCase):
+    """Рецепты двух авторов с тегами и ингредиентами, часть — у user."""
+    recipes_count = 60
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='user@test.local', username='user'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.authors = [
+            User.objects.create(email=f'author{n}@test.local',
+                                username=f'author{n}')
+            for n in range(2)
+        ]
+        cls.tags = [
+            Tag.objects.create(name=slug, color='#000000', slug=slug)
+            for slug in ('breakfast', 'lunch', 'dinner')
+        ]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {n}', measurement_unit='г')
+            for n in range(10)
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.authors[n % 2],
+                name=f'Суп {n}' if n % 5 == 0 else f'Рецепт {n}',
+                text='текст', cooking_time=10,
+                image='recipes/images/test.jpg'
+            )
+            for n in range(cls.recipes_count)
+        ]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe,
+                             ingredient=ingredients[(n + i) % 10],
+                             amount=i + 1)
+            for n, recipe in enumerate(cls.recipes) for i in range(3)
+        )
+        # Каждый рецепт с двумя тегами: без дедупликации JOIN по тегам
+        # вернул бы рецепт дважды.
+        ReceiptTag.objects.bulk_create(
+            ReceiptTag(recipe=recipe, tag=cls.tags[(n + i) % 3])
+            for n, recipe in enumerate(cls.recipes) for i in range(2)
+        )
+        for recipe in cls.recipes[::3]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[::4]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=cls.authors[0])
+        # Сигналы обновляют вектор и рейтинг после коммита, которого
+        # в TestCase нет.
+        Recipe.objects.update_search_vector()
+        now = timezone.now()
+        RecipeScore.objects.bulk_create(
+            RecipeScore(recipe=recipe, score=n, computed_at=now)
+            for n, recipe in enumerate(cls.recipes) if n % 2
+        )
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+
+class RecipeListQueriesTest(RecipeAPITestCase):
+    """Страница списка стоит одинаково при любом размере."""
+
+    def assert_page_queries(self, client, expected):
+        for limit in (1, 50):
+            # Фрагменты и токены кэшируются: считаем с холодного кэша.
+            cache.clear()
+            token_cache.clear()
+            with self.subTest(limit=limit):
+                with query_budget(expected):
+                    response = client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        # count, страница, рецепты, авторы, теги, ингредиенты.
+        self.assert_page_queries(self.anonymous, 6)
+
+    def test_authenticated(self):
+        # Плюс токен и три выборки флагов поверх фрагментов.
+        self.assert_page_queries(self.client, 10)
+
+    def test_user_flags(self):
+        response = self.client.get('/api/recipes/?limit=60')
+        by_id = {item['id']: item for item in response.data['results']}
+        favorited = self.recipes[0]
+        self.assertTrue(by_id[favorited.id]['is_favorited'])
+        self.assertTrue(by_id[favorited.id]['is_in_shopping_cart'])
+        self.assertTrue(by_id[favorited.id]['author']['is_subscribed'])
+        other = self.recipes[1]
+        self.assertFalse(by_id[other.id]['is_favorited'])
+        self.assertFalse(by_id[other.id]['is_in_shopping_cart'])
+        self.assertFalse(by_id[other.id]['author']['is_subscribed'])
+
+
+class RecipeFilterQueriesTest(RecipeAPITestCase):
+    """Фильтры не добавляют запросов и не размножают строки."""
+
+    def expected(self, **params):
+        """Рецепты, которые должен вернуть фильтр."""
+        tags = {self.tags.index(tag) for tag in Tag.objects.filter(
+            slug__in=params.get('tags', ())
+        )}
+        numbers = []
+        for n in range(self.recipes_count):
+            if tags and not tags & {n % 3, (n + 1) % 3}:
+                continue
+            if 'author' in params and n % 2:
+                continue
+            if 'is_favorited' in params and n % 3:
+                continue
+            if 'is_in_shopping_cart' in params and n % 4:
+                continue
+            if 'search' in params and n % 5:
+                continue
+            if 'ordering' in params and not n % 2:
+                continue
+            numbers.append(n)
+        return [self.recipes[n].id for n in numbers]
+
+    def assert_filter(self, client, params, expected_queries, expected):
+        cache.clear()
+        token_cache.clear()
+        params = dict(params, limit=self.recipes_count)
+        with CaptureQueriesContext(connection) as queries:
+            with query_budget(expected_queries):
+                response = client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.data['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(sorted(ids), sorted(expected))
+        self.assertEqual(response.data['count'], len(expected))
+        for query in queries:
+            self.assertNotIn('DISTINCT', query['sql'])
+        return ids, queries
+
+    def test_filters(self):
+        author = self.authors[0].id
+        cases = (
+            {'tags': ['breakfast']},
+            {'tags': ['breakfast', 'lunch']},
+            {'author': author},
+            {'is_favorited': 1},
+            {'is_in_shopping_cart': 1},
+            {'search': 'суп'},
+            {'ordering': 'popular'},
+            {'tags': ['breakfast'], 'author': author, 'is_favorited': 1,
+             'is_in_shopping_cart': 1},
+            {'search': 'суп', 'tags': ['lunch']},
+            {'ordering': 'popular', 'tags': ['breakfast'],
+             'is_favorited': 1},
+        )
+        for params in cases:
+            with self.subTest(**params):
+                # Как у списка без фильтров, плюс слаги тегов при
+                # холодном кэше.
+                self.assert_filter(
+                    self.client, params, 10 + ('tags' in params),
+                    self.expected(**params)
+                )
+
+    def test_tags_use_exists(self):
+        _, queries = self.assert_filter(
+            self.client, {'tags': ['breakfast', 'lunch']}, 11,
+            self.expected(tags=['breakfast', 'lunch'])
+        )
+        page = [query['sql'] for query in queries
+                if 'recipes_receipttag' in query['sql']
+                and 'COUNT(' not in query['sql']][0]
+        self.assertIn('EXISTS', page)
+        self.assertNotIn('JOIN "recipes_receipttag"', page)
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {page}')
+            plan = '\n'.join(str(row[0]) for row in cursor.fetchall())
+        # Дубли рецептов не схлопываются после JOIN: узла Unique нет.
+        self.assertNotIn('Unique', plan)
+
+    def test_popular_order(self):
+        ids, _ = self.assert_filter(
+            self.anonymous, {'ordering': 'popular'}, 6,
+            self.expected(ordering='popular')
+        )
+        self.assertEqual(ids, self.expected(ordering='popular')[::-1])
+
+    def test_anonymous(self):
+        self.assert_filter(
+            self.anonymous,
+            {'tags': ['breakfast'], 'author': self.authors[0].id}, 7,
+            self.expected(tags=['breakfast'], author=True)
+        )
+
+    def test_anonymous_user_filters(self):
+        # Избранного и корзины у анонима нет: пустая выборка без SQL.
+        for params in ({'is_favorited': 1}, {'is_in_shopping_cart': 1}):
+            with self.subTest(**params):
+                self.assert_filter(self.anonymous, params, 0, [])
+
+
+@override_settings(FEED_FANOUT_LIMIT=1)
+class FeedFanoutLimitTest(RecipeAPITestCase):
+    """Автор, вернувшийся под порог, снова раскладывается по лентам."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.authors[0]
+        self.other = User.objects.create(
+            email='other@test.local', username='other'
+        )
+        Follow.objects.create(user=self.other, author=self.author)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 2)
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+
+    def assert_backfilled(self):
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=self.user).values_list(
+                'recipe_id', flat=True
+            )),
+            set(self.author.recipes.values_list('id', flat=True))
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=self.other).exists())
+
+    def test_unfollow(self):
+        client = APIClient()
+        client.force_authenticate(self.other)
+        response = client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_backfilled()
+
+    def test_follow_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.filter(user=self.other).delete()
+        self.assert_backfilled()
+
+
+class RecipeUpdateQueriesTest(RecipeAPITestCase):
+    """Правка состава рецепта стоит одинаково при любом числе строк."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Салат', text='текст', cooking_time=5,
+            image='recipes/images/test.jpg'
+        )
+        self.ingredients = list(Ingredient.objects.order_by('id'))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=self.recipe, ingredient=ingredient,
+                             amount=10)
+            for ingredient in self.ingredients
+        )
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.authors[0], recipe=self.recipe)
+
+    def patch(self, ingredients):
+        return self.client.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            {
+                'name': 'Салат',
+                'text': 'текст',
+                'cooking_time': 5,
+                'tags': [self.tags[0].id],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 10}
+                    for ingredient in ingredients
+                ],
+            },
+            format='json'
+        )
+
+    def queries(self, ingredients):
+        cache.clear()
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch(ingredients)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_removed_rows(self):
+        self.patch(self.ingredients)
+        # Удалить две строки или восемь — одинаковое число запросов.
+        self.assertEqual(
+            self.queries(self.ingredients[:8]),
+            self.queries(self.ingredients[:2])
+        )
+
+    def test_shopping_lists_follow_removal(self):
+        self.patch(self.ingredients[:2])
+        # Готовые суммы совпадают с пересчётом по корзине с нуля.
+        for user in (self.user, self.authors[0]):
+            with self.subTest(user=user.username):
+                self.assertEqual(
+                    list(get_shopping_list(user)),
+                    list(get_cart_ingredients(user))
+                )
+
+
+class RecipeCursorPaginationTest(RecipeAPITestCase):
+
+    def test_pages_by_date(self):
+        response = self.anonymous.get(
+            '/api/recipes/', {'pagination': 'cursor', 'limit': 5}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [recipe.id for recipe in self.recipes[::-1][:5]]
+        )
+
+    def test_rejects_own_ordering(self):
+        # Курсор по дате потерял бы порядок популярности и релевантности.
+        for params in ({'ordering': 'popular'}, {'search': 'суп'}):
+            with self.subTest(**params):
+                response = self.anonymous.get(
+                    '/api/recipes/', dict(params, pagination='cursor')
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('pagination', response.data)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+    'LOCATION': 'django_cache',
+}})
+class IngredientSearchTest(TestCase):
+    """Поиск сверяет версию индекса в памяти, а не в кэше на каждый запрос."""
+
+    def test_search_without_queries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='морковь', measurement_unit='г')
+        client = APIClient()
+        client.get('/api/ingredients/?name=мор')
+        with query_budget(0):
+            for name in ('м', 'мо', 'мор', 'морк'):
+                response = client.get('/api/ingredients/', {'name': name})
+                self.assertEqual(response.json()[0]['name'], 'морковь')
+
+    def test_own_change_visible_at_once(self):
+        client = APIClient()
+        client.get('/api/ingredients/?name=све')
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='свекла', measurement_unit='г')
+        response = client.get('/api/ingredients/?name=све')
+        self.assertEqual(response.json()[0]['name'], 'свекла')
+
+
+@unittest.skipUnless(
+    connection.vendor == 'postgresql', 'EXPLAIN-аудит только для PostgreSQL'
+)
+class IndexAuditTest(RecipeAPITestCase):
+    """Запросы audit_indexes находят индекс для каждой таблицы.
+
+    Таблицы в тесте маленькие, и планировщик честно выбрал бы
+    последовательное чтение. С enable_seqscan = off он выбирает его,
+    только когда подходящего индекса нет.
+    """
+
+    def test_no_seq_scan(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        out = io.StringIO()
+        try:
+            call_command(
+                'audit_indexes', analyze=True, min_rows=0, stdout=out
+            )
+        except CommandError as error:
+            self.fail(f'{error}\n{out.getvalue()}')
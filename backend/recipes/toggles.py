@@ -0,0 +1,237 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Exists, F, OuterRef
+from django.http import Http404
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.settings import api_settings
+
+from . import feed, shopping_list
+from .models import Favorite, FeedEntry, Follow, Recipe, ShoppingCart
+
+User = get_user_model()
+
+COUNTERS = {Favorite: 'favorites_count', ShoppingCart: 'in_carts_count'}
+MESSAGES = {
+    Favorite: ('Рецепт уже добавлен в избранное', 'Рецепта нет в избранном'),
+    ShoppingCart: ('Продукты уже в корзине', 'Рецепта нет в корзине'),
+}
+
+# В PostgreSQL переключатель — один оператор: вставка или удаление
+# связей вместе со счётчиком (и лентой для подписок) в одном CTE.
+# Сигналы при этом не отправляются, их работу делает сам оператор.
+ADD_MARK = '''
+WITH inserted AS (
+    INSERT INTO {mark} (user_id, recipe_id, added_date)
+    SELECT %s, id, now() FROM {recipe} WHERE id = ANY(%s)
+    ON CONFLICT DO NOTHING
+    RETURNING recipe_id
+)
+UPDATE {recipe} SET {counter} = {counter} + 1
+FROM inserted WHERE {recipe}.id = inserted.recipe_id
+RETURNING {recipe}.id, {recipe}.name, {recipe}.image,
+    {recipe}.image_variants, {recipe}.cooking_time
+'''
+REMOVE_MARK = '''
+WITH deleted AS (
+    DELETE FROM {mark} WHERE user_id = %s AND recipe_id = ANY(%s)
+    RETURNING recipe_id
+)
+UPDATE {recipe} SET {counter} = {counter} - 1
+FROM deleted WHERE {recipe}.id = deleted.recipe_id
+RETURNING {recipe}.id
+'''
+FOLLOW = '''
+WITH inserted AS (
+    INSERT INTO {follow} (user_id, author_id, created_at)
+    SELECT %(user)s, id, now() FROM {user} WHERE id = %(author)s
+    ON CONFLICT DO NOTHING
+    RETURNING author_id
+), counted AS (
+    UPDATE {user} SET followers_count = followers_count + 1
+    FROM inserted WHERE {user}.id = inserted.author_id
+    RETURNING {user}.*
+), backfilled AS (
+    INSERT INTO {feed} (user_id, recipe_id, author_id, pub_date)
+    SELECT %(user)s, recipe.id, recipe.author_id, recipe.pub_date
+    FROM {recipe} recipe JOIN counted ON recipe.author_id = counted.id
+    WHERE counted.followers_count <= %(fanout_limit)s
+    ORDER BY recipe.pub_date DESC, recipe.id DESC
+    LIMIT %(backfill)s
+    ON CONFLICT DO NOTHING
+)
+SELECT * FROM counted
+'''
+UNFOLLOW = '''
+WITH deleted AS (
+    DELETE FROM {follow} WHERE user_id = %(user)s AND author_id = %(author)s
+    RETURNING author_id
+), pruned AS (
+    DELETE FROM {feed} WHERE user_id = %(user)s
+        AND author_id IN (SELECT author_id FROM deleted)
+)
+UPDATE {user} SET followers_count = followers_count - 1
+FROM deleted WHERE {user}.id = deleted.author_id
+RETURNING {user}.followers_count
+'''
+
+
+def reject(message):
+    raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]})
+
+
+def tables(**models):
+    return {name: model._meta.db_table for name, model in models.items()}
+
+
+def is_postgresql(alias):
+    return connections[alias].vendor == 'postgresql'
+
+
+def add_marks(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или корзину одной пачкой.
+
+    Возвращает добавленные рецепты по id и множество несуществующих id,
+    остальные id уже были добавлены раньше.
+    """
+    alias = router.db_for_write(model)
+    with transaction.atomic(using=alias):
+        if is_postgresql(alias):
+            sql = ADD_MARK.format(
+                counter=COUNTERS[model], **tables(mark=model, recipe=Recipe)
+            )
+            added = {recipe.id: recipe for recipe in Recipe.objects.raw(
+                sql, [user.id, list(recipe_ids)], using=alias
+            )}
+        else:
+            added = {
+                recipe.id: recipe for recipe in
+                Recipe.objects.using(alias).filter(pk__in=recipe_ids).exclude(
+                    Exists(model.objects.filter(
+                        user=user, recipe=OuterRef('pk')
+                    ))
+                )
+            }
+            # bulk_create не шлёт сигналы, счётчик обновляется отдельно.
+            model.objects.using(alias).bulk_create(
+                model(user=user, recipe_id=pk) for pk in added
+            )
+            counter = COUNTERS[model]
+            Recipe.objects.using(alias).filter(pk__in=added).update(
+                **{counter: F(counter) + 1}
+            )
+        if model is ShoppingCart:
+            shopping_list.change_recipes(user.id, added, 1)
+    return added, missing_recipes(alias, set(recipe_ids) - added.keys())
+
+
+def remove_marks(model, user, recipe_ids):
+    """Убирает рецепты из избранного или корзины одной пачкой.
+
+    Возвращает множества удалённых и несуществующих id.
+    """
+    alias = router.db_for_write(model)
+    if not is_postgresql(alias):
+        with transaction.atomic(using=alias):
+            marks = model.objects.using(alias).filter(
+                user=user, recipe_id__in=recipe_ids
+            )
+            removed = set(marks.values_list('recipe_id', flat=True))
+            # Счётчики и список покупок поправят сигналы post_delete.
+            marks.delete()
+        return removed, missing_recipes(alias, set(recipe_ids) - removed)
+    sql = REMOVE_MARK.format(
+        counter=COUNTERS[model], **tables(mark=model, recipe=Recipe)
+    )
+    with transaction.atomic(using=alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(sql, [user.id, list(recipe_ids)])
+            removed = {row[0] for row in cursor.fetchall()}
+        if model is ShoppingCart:
+            shopping_list.change_recipes(user.id, removed, -1)
+    return removed, missing_recipes(alias, set(recipe_ids) - removed)
+
+
+def missing_recipes(alias, recipe_ids):
+    """Какие из id, которые ничего не изменили, не существуют вовсе."""
+    if not recipe_ids:
+        return set()
+    return recipe_ids - set(Recipe.objects.using(alias).filter(
+        pk__in=recipe_ids
+    ).values_list('id', flat=True))
+
+
+def add_mark(model, user, recipe_id):
+    """Добавляет один рецепт и возвращает его.
+
+    Повторное добавление — 400, несуществующий рецепт — 404.
+    """
+    added, not_found = add_marks(model, user, [recipe_id])
+    if recipe_id in not_found:
+        raise Http404
+    if recipe_id not in added:
+        reject(MESSAGES[model][0])
+    return added[recipe_id]
+
+
+def remove_mark(model, user, recipe_id):
+    removed, not_found = remove_marks(model, user, [recipe_id])
+    if recipe_id in not_found:
+        raise Http404
+    if recipe_id not in removed:
+        reject(MESSAGES[model][1])
+
+
+def follow(user, author_id):
+    """Подписывает user на автора и возвращает автора."""
+    if user.id == author_id:
+        reject('Нельзя подписаться на самого себя')
+    alias = router.db_for_write(Follow)
+    if is_postgresql(alias):
+        sql = FOLLOW.format(**tables(
+            follow=Follow, user=User, feed=FeedEntry, recipe=Recipe
+        ))
+        authors = list(User.objects.raw(sql, {
+            'user': user.id,
+            'author': author_id,
+            'fanout_limit': settings.FEED_FANOUT_LIMIT,
+            'backfill': settings.FEED_BACKFILL,
+        }, using=alias))
+        if authors:
+            return authors[0]
+        if not User.objects.using(alias).filter(pk=author_id).exists():
+            raise Http404
+        reject('Подписка существует')
+    author = get_object_or_404(User.objects.using(alias), pk=author_id)
+    try:
+        with transaction.atomic(using=alias):
+            Follow.objects.create(user=user, author=author)
+    except IntegrityError:
+        reject('Подписка существует')
+    return author
+
+
+def unfollow(user, author_id):
+    alias = router.db_for_write(Follow)
+    if is_postgresql(alias):
+        sql = UNFOLLOW.format(**tables(
+            follow=Follow, user=User, feed=FeedEntry
+        ))
+        with transaction.atomic(using=alias):
+            with connections[alias].cursor() as cursor:
+                cursor.execute(sql, {'user': user.id, 'author': author_id})
+                counted = cursor.fetchone()
+            deleted = counted is not None
+            # Автор вернулся под порог: его рецепты снова живут в лентах.
+            if deleted and counted[0] == settings.FEED_FANOUT_LIMIT:
+                feed.backfill_followers(author_id)
+    else:
+        deleted, _ = Follow.objects.using(alias).filter(
+            user=user, author_id=author_id
+        ).delete()
+    if deleted:
+        return
+    if not User.objects.using(alias).filter(pk=author_id).exists():
+        raise Http404
+    reject('Подписки не существует')
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import Favorite, RecipeScore, ShoppingCart
+
+# Один проход по добавлениям за окно: каждое весит weight и вдвое
+# теряет вес за half_life. Считается во float8: с numeric, который
+# дают EXTRACT и параметры-числа, POWER на порядок медленнее.
+# Рецепты без недавней активности удаляются, остальные
+# перезаписываются на месте.
+UPDATE_SCORES = '''
+WITH events AS (
+    SELECT recipe_id, added_date, %(favorite_weight)s::float8 AS weight
+    FROM {favorite} WHERE added_date >= %(since)s
+    UNION ALL
+    SELECT recipe_id, added_date, %(cart_weight)s::float8 AS weight
+    FROM {cart} WHERE added_date >= %(since)s
+), scores AS (
+    SELECT recipe_id, SUM(weight * POWER(
+        2.0, -EXTRACT(EPOCH FROM %(now)s - added_date)::float8
+        / %(half_life)s
+    )) AS score
+    FROM events GROUP BY recipe_id
+), stale AS (
+    DELETE FROM {score}
+    WHERE recipe_id NOT IN (SELECT recipe_id FROM scores)
+)
+INSERT INTO {score} (recipe_id, score, computed_at)
+SELECT recipe_id, score, %(now)s FROM scores
+ON CONFLICT (recipe_id)
+DO UPDATE SET score = excluded.score, computed_at = excluded.computed_at
+'''
+
+
+def update_scores(now=None):
+    """Пересчитывает RecipeScore и возвращает число рецептов в нём."""
+    now = now or timezone.now()
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+    alias = router.db_for_write(RecipeScore)
+    if connections[alias].vendor != 'postgresql':
+        return update_scores_in_python(alias, now, since, half_life)
+    sql = UPDATE_SCORES.format(
+        favorite=Favorite._meta.db_table,
+        cart=ShoppingCart._meta.db_table,
+        score=RecipeScore._meta.db_table,
+    )
+    with connections[alias].cursor() as cursor:
+        cursor.execute(sql, {
+            'favorite_weight': settings.TRENDING_FAVORITE_WEIGHT,
+            'cart_weight': settings.TRENDING_CART_WEIGHT,
+            'since': since,
+            'now': now,
+            'half_life': half_life,
+        })
+        return cursor.rowcount
+
+
+def update_scores_in_python(alias, now, since, half_life):
+    """То же для SQLite: суммы считаются на Python."""
+    scores = {}
+    for model, weight in (
+        (Favorite, settings.TRENDING_FAVORITE_WEIGHT),
+        (ShoppingCart, settings.TRENDING_CART_WEIGHT),
+    ):
+        for recipe_id, added_date in model.objects.using(alias).filter(
+            added_date__gte=since
+        ).values_list('recipe_id', 'added_date'):
+            age = (now - added_date).total_seconds()
+            scores[recipe_id] = (
+                scores.get(recipe_id, 0) + weight * 2 ** (-age / half_life)
+            )
+    with transaction.atomic(using=alias):
+        RecipeScore.objects.using(alias).all().delete()
+        RecipeScore.objects.using(alias).bulk_create(
+            RecipeScore(recipe_id=recipe_id, score=score, computed_at=now)
+            for recipe_id, score in scores.items()
+        )
+    return len(scores)
@@ -1,17 +1,33 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
+    FavoriteBatchViewSet,
     FavoriteViewSet,
     IngredientViewSet,
     RecipeViewSet,
+    ShoppingCartBatchViewSet,
     ShoppingCartViewSet,
     TagViewSet,
     ListFollowViewSet,
     FollowViewSet,
-    DownloadShoppingCart
+    DownloadShoppingCart,
+    ShoppingCartSummary,
+    FeedViewSet
 )
 
+if settings.ASYNC_TOGGLE_VIEWS:
+    from . import async_views
+
+    favorite_view = async_views.favorite
+    shopping_cart_view = async_views.shopping_cart
+    subscribe_view = async_views.subscribe
+else:
+    favorite_view = FavoriteViewSet.as_view()
+    shopping_cart_view = ShoppingCartViewSet.as_view()
+    subscribe_view = FollowViewSet.as_view()
+
 router = DefaultRouter()
 
 router.register('tags', TagViewSet)
@@ -22,12 +38,19 @@ urlpatterns = [
     path('users/subscriptions/',
          ListFollowViewSet.as_view(), name='subscriptions'),
     path('users/<int:author_id>/subscribe/',
-         FollowViewSet.as_view(), name='subscribe'),
+         subscribe_view, name='subscribe'),
     path('recipes/download_shopping_cart/',
          DownloadShoppingCart.as_view(), name='dowload_shopping_cart'),
+    path('recipes/favorite/',
+         FavoriteBatchViewSet.as_view(), name='favorite_batch'),
+    path('recipes/shopping_cart/',
+         ShoppingCartBatchViewSet.as_view(), name='shopping_cart_batch'),
+    path('recipes/shopping_cart/summary/',
+         ShoppingCartSummary.as_view(), name='shopping_cart_summary'),
+    path('recipes/feed/', FeedViewSet.as_view(), name='feed'),
     path('recipes/<int:recipe_id>/favorite/',
-         FavoriteViewSet.as_view(), name='favorite'),
+         favorite_view, name='favorite'),
     path('recipes/<int:recipe_id>/shopping_cart/',
-         ShoppingCartViewSet.as_view(), name='shopping_cart'),
+         shopping_cart_view, name='shopping_cart'),
     path('', include(router.urls)),
 ]
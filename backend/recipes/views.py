@@ -1,32 +1,40 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.db.models import BooleanField, Prefetch, Value
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status, generics
-from rest_framework.generics import get_object_or_404
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
+from . import toggles
+from .exports import export
+from .feed import InvalidCursor, get_feed_page
 from .filters import RecipeFilter, IngredientFilter
+from .fragments import render_recipes
 from .models import (Tag,
                      Ingredient,
                      Recipe,
                      Favorite,
-                     ShoppingCart,
-                     RecipeIngredient,
-                     Follow
+                     ShoppingCart
                      )
-from .paginators import CustomPageNumberPaginator
+from .paginators import CustomPageNumberPaginator, RecipeCursorPaginator
 from .permissions import AdminOrAuthorOrReadOnly
+from .renderers import CsvRenderer, PdfRenderer, TxtRenderer
 from .serializers import (TagSerializer,
                           IngredientSerializer,
                           ShowRecipeSerializer,
                           CreateRecipeSerializer,
-                          FavoriteSerializer,
-                          ShoppingCartSerializer,
-                          ShowFollowSerializer,
-                          FollowSerializer
+                          ShowRecipeAddedSerializer,
+                          RecipeIdsSerializer,
+                          ShowFollowSerializer
                           )
+from .search import search_ingredients
+from .shopping_list import get_shopping_list, readable
 
 User = get_user_model()
 
@@ -46,6 +54,12 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(search_ingredients(name))
+        return super().list(request, *args, **kwargs)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
@@ -54,148 +68,240 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_class = RecipeFilter
     pagination_class = CustomPageNumberPaginator
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = RecipeCursorPaginator()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return ShowRecipeSerializer
         return CreateRecipeSerializer
 
+    def get_queryset(self):
+        if self.action == 'list':
+            return Recipe.objects.only('id', 'author', 'pub_date')
+        if self.request.method == 'GET':
+            return Recipe.objects.for_show(self.request.user)
+        return Recipe.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(render_recipes(page, request))
+        return Response(render_recipes(list(queryset), request))
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context.update({'request': self.request})
         return context
 
 
-class FavoriteViewSet(APIView):
+class RecipeMarkViewSet(APIView):
+    """Добавление рецепта в избранное или корзину и удаление из них."""
     permission_classes = [IsAuthenticated, ]
+    model = None
 
     def get(self, request, recipe_id):
-        user = request.user
-        data = {
-            'user': user.id,
-            'recipe': recipe_id,
-        }
-        serializer = FavoriteSerializer(
-            data=data,
+        recipe = toggles.add_mark(self.model, request.user, recipe_id)
+        serializer = ShowRecipeAddedSerializer(
+            recipe,
             context={'request': request}
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(
-            serializer.data,
-            status=status.HTTP_201_CREATED
-        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, recipe_id):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-
-        # Favorite.objects.get(
-        #     user=user,
-        #     recipe=recipe).delete()
-        obj = get_object_or_404(Favorite, user=user, recipe=recipe)
-        obj.delete()
+        toggles.remove_mark(self.model, request.user, recipe_id)
         return Response(
             status=status.HTTP_204_NO_CONTENT
         )
 
 
-class ShoppingCartViewSet(APIView):
+class FavoriteViewSet(RecipeMarkViewSet):
+    model = Favorite
+
+
+class ShoppingCartViewSet(RecipeMarkViewSet):
+    model = ShoppingCart
+
+
+class RecipeMarkBatchViewSet(APIView):
+    """Пачка рецептов в избранное или корзину за один запрос.
+
+    POST добавляет, DELETE убирает рецепты из {"recipes": [id, ...]} в
+    одной транзакции и возвращает статус по каждому id.
+    """
     permission_classes = [IsAuthenticated, ]
+    model = None
 
-    def get(self, request, recipe_id):
-        user = request.user
-        data = {
-            'user': user.id,
-            'recipe': recipe_id,
-        }
-
-        context = {'request': request}
-        serializer = ShoppingCartSerializer(data=data, context=context)
+    def get_recipe_ids(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-    def delete(self, request, recipe_id):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=recipe_id)
+        return serializer.validated_data['recipes']
+
+    def get_results(self, recipe_ids, done, not_found, statuses):
+        done_status, skipped_status = statuses
+        results = []
+        for pk in recipe_ids:
+            if pk in done:
+                result = done_status
+            elif pk in not_found:
+                result = 'not_found'
+            else:
+                result = skipped_status
+            results.append({'id': pk, 'status': result})
+        return Response({'results': results})
+
+    def post(self, request):
+        recipe_ids = self.get_recipe_ids(request)
+        added, not_found = toggles.add_marks(
+            self.model, request.user, recipe_ids
+        )
+        return self.get_results(
+            recipe_ids, added, not_found, ('added', 'exists')
+        )
 
-        # ShoppingCart.objects.get(user=user, recipe=recipe).delete()
-        obj = get_object_or_404(ShoppingCart, user=user, recipe=recipe)
-        obj.delete()
-        return Response(
-            status=status.HTTP_204_NO_CONTENT
+    def delete(self, request):
+        recipe_ids = self.get_recipe_ids(request)
+        removed, not_found = toggles.remove_marks(
+            self.model, request.user, recipe_ids
         )
+        return self.get_results(
+            recipe_ids, removed, not_found, ('removed', 'missing')
+        )
+
+
+class FavoriteBatchViewSet(RecipeMarkBatchViewSet):
+    model = Favorite
+
+
+class ShoppingCartBatchViewSet(RecipeMarkBatchViewSet):
+    model = ShoppingCart
 
 
 class DownloadShoppingCart(APIView):
+    """Список покупок файлом: ?format=txt (по умолчанию), csv или pdf."""
     permission_classes = (IsAuthenticated,)
+    renderer_classes = (TxtRenderer, CsvRenderer, PdfRenderer)
 
     def get(self, request):
-        shopping_cart = request.user.shopping_cart.all()
-        buying_list = {}
-
-        for item in shopping_cart:
-            ingredients = RecipeIngredient.objects.filter(recipe=item.recipe)
-            for ingredient in ingredients:
-                amount = ingredient.amount
-                name = ingredient.ingredient.name
-                measurement_unit = ingredient.ingredient.measurement_unit
-
-                if name not in buying_list:
-                    buying_list[name] = {
-                        'measurement_unit': measurement_unit,
-                        'amount': amount
-                    }
-                else:
-                    buying_list[name]['amount'] = (buying_list[name]['amount']
-                                                   + amount)
-
-        wishlist = []
-        for item in buying_list:
-            wishlist.append(f'{item} - {buying_list[item]["amount"]} '
-                            f'{buying_list[item]["measurement_unit"]} \n')
-
-        response = HttpResponse(wishlist, 'Content-Type: text/plain')
-        response['Content-Disposition'] = 'attachment; filename="wishlist.txt"'
+        rows = [(item['ingredient__name'], *readable(item))
+                for item in get_shopping_list(request.user)]
+        fmt = request.accepted_renderer.format
+        response = Response(export(fmt, rows))
+        response['Content-Disposition'] = (
+            f'attachment; filename="wishlist.{fmt}"'
+        )
         return response
 
+    def handle_exception(self, exc):
+        # Ошибки (401, неизвестный формат) отдаются JSON, а не «файлом».
+        response = super().handle_exception(exc)
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return response
+
+
+class ShoppingCartSummary(APIView):
+    """Сводка корзины: число рецептов и готовый список покупок."""
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        ingredients = []
+        for item in get_shopping_list(request.user):
+            amount, unit = readable(item)
+            ingredients.append({
+                'name': item['ingredient__name'],
+                'amount': amount,
+                'measurement_unit': unit,
+            })
+        return Response({
+            'recipes': ShoppingCart.objects.filter(user=request.user).count(),
+            'ingredients': ingredients,
+        })
+
 
 class ListFollowViewSet(generics.ListAPIView):
     queryset = User.objects.all()
     permission_classes = [IsAuthenticated, ]
     serializer_class = ShowFollowSerializer
 
+    def get_recipes_limit(self):
+        try:
+            limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return settings.RECIPES_LIMIT
+        return max(limit, 0)
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context.update({'request': self.request})
+        context.update({
+            'request': self.request,
+            'recipes_limit': self.get_recipes_limit(),
+        })
         return context
 
     def get_queryset(self):
         user = self.request.user
-        return User.objects.filter(following__user=user) 
+        recipes = Recipe.objects.filter(
+            author__following__user=user
+        ).latest_per_author(self.get_recipes_limit())
+        return User.objects.filter(following__user=user).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).order_by('username').prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
 
-class FollowViewSet(APIView):
+
+class FeedViewSet(APIView):
+    """Лента рецептов авторов, на которых подписан пользователь."""
     permission_classes = [IsAuthenticated, ]
 
-    def get(self, request, author_id):
-        user = request.user
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return min(max(limit, 1), settings.FEED_MAX_PAGE_SIZE)
 
-        data = {
-            'user': user.id,
-            'author': author_id
-        }
-        serializer = FollowSerializer(data=data, context={'request': request})
+    def get(self, request):
+        cursor = request.query_params.get('cursor')
+        try:
+            page, next_cursor = get_feed_page(
+                request.user, cursor, self.get_limit()
+            )
+        except InvalidCursor:
+            raise NotFound('Неверный курсор.')
+        next_url = None
+        if next_cursor is not None:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'cursor', next_cursor
+            )
+        return Response({
+            'next': next_url,
+            'results': render_recipes(page, request),
+        })
 
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+
+class FollowViewSet(APIView):
+    permission_classes = [IsAuthenticated, ]
+
+    def get(self, request, author_id):
+        author = toggles.follow(request.user, author_id)
+        author.is_subscribed = True
+        serializer = ShowFollowSerializer(
+            author,
+            context={'request': request}
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, author_id):
-        user = request.user
-        author = get_object_or_404(User, id=author_id)
-        obj = get_object_or_404(Follow, user=user, author=author)
-        obj.delete()
-
+        toggles.unfollow(request.user, author_id)
         return Response(
             status=status.HTTP_204_NO_CONTENT
         )
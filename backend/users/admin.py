@@ -5,6 +5,12 @@ from .models import User
 
 @admin.register(User)
 class User(admin.ModelAdmin):
+    list_display = (
+        'username',
+        'email',
+        'recipes_count',
+        'followers_count',
+    )
     list_filter = (
         'email',
         'username',
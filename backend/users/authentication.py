@@ -0,0 +1,114 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+GENERATION_KEY = 'auth_token:generation'
+
+
+class TokenCache:
+    """LRU-кэш токен → (пользователь, токен) в памяти процесса с TTL.
+
+    Поиск всегда идёт в памяти. Бэкенд shared (по умолчанию) сообщает
+    об отзыве другим процессам через поколение в общем кэше Django:
+    отзыв меняет поколение, а процесс сверяет его не чаще раза в
+    REVOCATION_CHECK секунд и при расхождении сбрасывает свои записи.
+    Бэкенд local не ходит в общий кэш, и в других процессах отозванный
+    токен действует ещё до TTL секунд, поэтому он годится лишь для
+    одного процесса.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = None
+        self.checked_at = None
+
+    @property
+    def options(self):
+        return settings.TOKEN_AUTH_CACHE
+
+    @property
+    def shared(self):
+        return self.options['BACKEND'] == 'shared'
+
+    def check_generation(self):
+        now = time.monotonic()
+        with self.lock:
+            if (self.checked_at is not None
+                    and now - self.checked_at
+                    < self.options['REVOCATION_CHECK']):
+                return
+            self.checked_at = now
+        generation = cache.get(GENERATION_KEY)
+        with self.lock:
+            if generation != self.generation:
+                self.generation = generation
+                self.entries.clear()
+
+    def get(self, key):
+        if self.shared:
+            self.check_generation()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        user, token = value
+        # Копия пользователя, чтобы запросы не делили один объект.
+        return copy.copy(user), token
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (
+                value, time.monotonic() + self.options['TTL']
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.options['MAX_SIZE']:
+                self.entries.popitem(last=False)
+
+    def revoke(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        if not self.shared:
+            return
+        generation = uuid4().hex
+        cache.set(GENERATION_KEY, generation, None)
+        with self.lock:
+            self.generation = generation
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation = None
+            self.checked_at = None
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к authtoken_token на каждый вызов."""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        user, token = cached
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                'User inactive or deleted.'
+            )
+        return user, token
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+DATABASE_CACHE = 'django.core.cache.backends.db.DatabaseCache'
+
+
+@register()
+def check_token_cache(app_configs, **kwargs):
+    """Поколение отзыва токенов читается из кэша по умолчанию.
+
+    Если кэш лежит в базе, каждая сверка — запрос к django_cache, и
+    кэш токенов экономит меньше, чем обещает.
+    """
+    if settings.TOKEN_AUTH_CACHE['BACKEND'] != 'shared':
+        return []
+    if settings.CACHES['default']['BACKEND'] != DATABASE_CACHE:
+        return []
+    return [Warning(
+        'Кэш токенов сверяет отзыв через кэш в базе данных.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION (memcached) или '
+             'увеличьте TOKEN_AUTH_CACHE_REVOCATION_CHECK.',
+        id='users.W001',
+    )]
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+
+from users.authentication import CachedTokenAuthentication, token_cache
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает TokenAuthentication и CachedTokenAuthentication: '
+            'время и число запросов к базе на один вызов API.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        token = Token.objects.select_related('user').first()
+        if token is None:
+            raise CommandError('Нет ни одного токена: войдите в API.')
+        factory = RequestFactory()
+        count = options['requests']
+        token_cache.revoke(token.key)
+        for authentication in (TokenAuthentication,
+                               CachedTokenAuthentication):
+            authenticator = authentication()
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(count):
+                    request = Request(
+                        factory.get(
+                            '/api/recipes/',
+                            HTTP_AUTHORIZATION=f'Token {token.key}'
+                        ),
+                        authenticators=[authenticator]
+                    )
+                    request.user
+                elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f'{authentication.__name__:<28} '
+                f'{elapsed / count * 1e6:>8.1f} мкс/запрос, '
+                f'запросов к базе {len(queries.captured_queries) / count:.3f}'
+            )
@@ -6,6 +6,12 @@ class User(AbstractUser):
 
     email = models.EmailField(unique=True, blank=False)
     username = models.CharField(unique=True, blank=False, max_length=20)
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='подписчиков'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def revoke_deleted_token(sender, instance, **kwargs):
+    token_cache.revoke(instance.key)
+
+
+@receiver(post_save, sender=User)
+def revoke_user_tokens(sender, instance, **kwargs):
+    # Смена пароля, блокировка и любые другие правки пользователя
+    # сбрасывают закэшированный токен, кроме отметки о входе.
+    if kwargs.get('update_fields') == frozenset(['last_login']):
+        return
+    token_cache.revoke(*Token.objects.filter(
+        user_id=instance.pk
+    ).values_list('key', flat=True))
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import (CachedTokenAuthentication, TokenCache,
+                             token_cache)
+
+User = get_user_model()
+
+LOCAL_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class TokenCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='user@test.local', username='user'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.auth = CachedTokenAuthentication()
+
+    def test_local_copies_user(self):
+        options = {'BACKEND': 'local', 'TTL': 30, 'MAX_SIZE': 10}
+        with self.settings(TOKEN_AUTH_CACHE=options):
+            self.auth.authenticate_credentials(self.token.key)
+            with self.assertNumQueries(0):
+                first, _ = self.auth.authenticate_credentials(
+                    self.token.key
+                )
+                second, _ = self.auth.authenticate_credentials(
+                    self.token.key
+                )
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+
+    def test_shared_revoked_on_deactivation(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            self.auth.authenticate_credentials(self.token.key)
+        # Отзыв идёт через общий кэш, его видят все процессы.
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_shared_lookup_in_memory(self):
+        database_cache = {'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }}
+        with self.settings(CACHES=database_cache):
+            self.auth.authenticate_credentials(self.token.key)
+            # Поколение уже сверено: ни django_cache, ни authtoken_token.
+            with self.assertNumQueries(0):
+                for _ in range(10):
+                    self.auth.authenticate_credentials(self.token.key)
+
+    def test_shared_revoked_in_other_process(self):
+        self.auth.authenticate_credentials(self.token.key)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        TokenCache().revoke(self.token.key)
+        # До сверки поколения процесс не знает об отзыве.
+        self.auth.authenticate_credentials(self.token.key)
+        options = {**settings.TOKEN_AUTH_CACHE, 'REVOCATION_CHECK': 0}
+        with self.settings(TOKEN_AUTH_CACHE=options):
+            with self.assertRaises(AuthenticationFailed):
+                self.auth.authenticate_credentials(self.token.key)